@@ -1,15 +1,51 @@
 import streamlit as st
 import gspread
+import requests
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import textwrap
 import re
+import os
 import time
+import random
+import threading
+import sqlite3
+import weakref
+import json
+import uuid
+try:
+    import fcntl
+except ImportError: # Windows: sem eleição, cada processo lê a planilha por conta própria
+    fcntl = None
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import planilha_local
+import metricas
+if int(pd.__version__.split(".")[0]) < 3: pd.set_option("mode.copy_on_write", True) # padrão (e único modo) a partir do pandas 3
+from eventos import (cores_niveis, dias_semana, STATUS_FILTRO, COLS_USUARIOS, COLS_VOLUNTARIOS, montar_df, colunas_planilha,
+                     montar_card, preparar_eventos, preparar_janela, preparar_usuarios, registro_usuario, email_norm, indexar_usuarios, slot, indexar_agenda, conflito, inscricoes, filtrar_eventos, MotorFiltros)
 
 # --- 1. CONEXÃO RESILIENTE ---
+def config(chave, padrao=None):
+    # Variável de ambiente tem precedência sobre st.secrets (testes de carga, benchmarks)
+    if chave in os.environ: return os.environ[chave]
+    try: return st.secrets.get(chave, padrao)
+    except Exception: return padrao # sem secrets.toml
+
+@st.cache_resource
+def get_metricas():
+    return metricas.Registro()
+
 @st.cache_resource
 def get_gspread_client():
+    with get_metricas().medir("cliente_gspread"): return _criar_cliente()
+
+def _criar_cliente():
+    # PLANILHA_BACKEND=local troca o Google Sheets pela planilha em memória/arquivo de planilha_local.py
+    if config("PLANILHA_BACKEND", "gspread") == "local":
+        return planilha_local.Cliente(arquivo=config("PLANILHA_ARQUIVO"), latencia=float(config("PLANILHA_LATENCIA", 0)),
+                                      erro_cota=float(config("PLANILHA_ERRO_COTA", 0)), cota_por_minuto=int(config("PLANILHA_COTA", 0)) or None)
     try:
         partes = [f"S{i}" for i in range(1, 22)]
         chave_full = "".join([re.sub(r'[^A-Za-z0-9+/=]', '', st.secrets[p]) for p in partes])
@@ -29,51 +65,907 @@ def get_gspread_client():
     except Exception:
         st.error("Erro crítico de conexão."); st.stop()
 
-@st.cache_data(ttl=300) # Cache de 5 minutos
-def load_data_cached():
-    client = get_gspread_client()
-    # Tentativas de leitura para evitar erro de cota
-    for tentativa in range(3):
+ID_PLANILHA = "1paP1ZB2ufwCc95T_gdCR92kx-suXbROnDfbWMC_ka0c"
+
+# Objetos Spreadsheet/Worksheet guardados junto do client: evita open_by_key + worksheet() a cada leitura/escrita
+@st.cache_resource
+def get_planilha():
+    return chamar_api("leitura", lambda: get_gspread_client().open_by_key(ID_PLANILHA))
+
+@st.cache_resource
+def get_sheets():
+    ss = get_planilha()
+    return chamar_api("leitura", lambda: (ss.worksheet("Calendario_Eventos"), ss.worksheet("Usuarios")))
+
+def descartar_handles(e):
+    # Só erro de autenticação ou planilha não encontrada (APIError 401/403/404) invalida os objetos guardados.
+    # Aba não encontrada (WorksheetNotFound) sai do próprio get_sheets, e o st.cache_resource não guarda
+    # exceção: a próxima chamada já abre as abas de novo.
+    status = e.response.status_code
+    if status in (401, 403, 404):
+        get_sheets.clear(); get_planilha.clear()
+        if status == 401: get_gspread_client.clear()
+
+# Limitador do servidor para todas as chamadas ao Sheets, compartilhado entre as sessões: um token bucket
+# por cota, porque o Sheets mede leituras e escritas separadamente. Na mesma cota a faixa de escrita passa
+# na frente da de leitura; um 429/5xx pausa a cota inteira (backoff exponencial com jitter) em vez de cada
+# sessão tentar de novo por conta própria.
+LIMITE_POR_MINUTO = 60 # Cota do Sheets por usuário (a conta de serviço) e por minuto, de leitura e de escrita
+COTAS = ("leitura", "escrita")
+RAJADA_API = 10
+TENTATIVAS_API = 4
+BACKOFF_BASE, BACKOFF_MAX = 1.0, 32.0
+
+@st.cache_resource
+def get_limitador():
+    agora = time.monotonic()
+    return {"baldes": {c: {"tokens": float(RAJADA_API), "t": agora} for c in COTAS}, "cond": threading.Condition(),
+            "esperando": {(faixa, c): 0 for faixa in ("escrita", "leitura") for c in COTAS}, "bloqueado_ate": {c: 0.0 for c in COTAS},
+            "contadores": {f"{faixa}_{c}": 0 for faixa in ("escrita", "leitura") for c in ("chamadas", "aguardou", "cota", "erro_servidor", "retentativas", "falhas")}}
+
+def _pegar_token(lim, faixa, cota):
+    with lim["cond"]:
+        lim["esperando"][(faixa, cota)] += 1; aguardou = False
+        balde = lim["baldes"][cota]
         try:
-            ss = client.open_by_key("1paP1ZB2ufwCc95T_gdCR92kx-suXbROnDfbWMC_ka0c")
-            
-            # Lendo Calendário
-            sheet_ev = ss.worksheet("Calendario_Eventos")
-            data_ev = sheet_ev.get_all_records()
-            df_ev = pd.DataFrame(data_ev)
-            df_ev.columns = [c.strip() for c in df_ev.columns]
-            
-            # Lendo Usuários
-            sheet_us = ss.worksheet("Usuarios") 
-            data_us = sheet_us.get_all_records()
-            df_us = pd.DataFrame(data_us) if data_us else pd.DataFrame(columns=['Email', 'Nome', 'Telefone', 'Departamentos', 'Nivel'])
-            df_us.columns = [c.strip() for c in df_us.columns]
-            
-            return df_ev, df_us
+            while True:
+                agora = time.monotonic()
+                balde["tokens"] = min(RAJADA_API, balde["tokens"] + (agora - balde["t"]) * LIMITE_POR_MINUTO / 60); balde["t"] = agora
+                vez = faixa == "escrita" or lim["esperando"][("escrita", cota)] == 0
+                if vez and agora >= lim["bloqueado_ate"][cota] and balde["tokens"] >= 1:
+                    balde["tokens"] -= 1; lim["contadores"][f"{faixa}_chamadas"] += 1; return
+                if not aguardou: lim["contadores"][f"{faixa}_aguardou"] += 1; aguardou = True
+                falta = max(lim["bloqueado_ate"][cota] - agora, (1 - balde["tokens"]) * 60 / LIMITE_POR_MINUTO, 0.05)
+                lim["cond"].wait(timeout=falta)
+        finally:
+            lim["esperando"][(faixa, cota)] -= 1; lim["cond"].notify_all()
+
+def chamar_api(faixa, chamada, tentativas=TENTATIVAS_API, cota=None):
+    # faixa: prioridade, "escrita" (inscrições, cadastros e as leituras que fazem parte deles) ou "leitura".
+    # cota: o que a chamada gasta no Sheets, "leitura" ou "escrita"; por padrão a mesma da faixa.
+    lim, cota = get_limitador(), cota or faixa
+    for tentativa in range(tentativas):
+        _pegar_token(lim, faixa, cota)
+        try:
+            with get_metricas().medir(f"sheets_{faixa}"): return chamada()
         except gspread.exceptions.APIError as e:
-            if tentativa < 2:
-                time.sleep(2) # Espera 2 segundos e tenta de novo
-                continue
+            descartar_handles(e)
+            status = e.response.status_code
+            with lim["cond"]: # contadores só mudam com o lock: contadores_api lê todos de uma vez
+                if status == 429: lim["contadores"][f"{faixa}_cota"] += 1
+                elif status >= 500: lim["contadores"][f"{faixa}_erro_servidor"] += 1
+                if (status != 429 and status < 500) or tentativa == tentativas - 1:
+                    lim["contadores"][f"{faixa}_falhas"] += 1; raise
+                lim["contadores"][f"{faixa}_retentativas"] += 1
+                espera = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** tentativa)) # "full jitter"
+                lim["bloqueado_ate"][cota] = max(lim["bloqueado_ate"][cota], time.monotonic() + espera)
+
+def erro_transitorio(e):
+    # Vale tentar de novo mais tarde: cota (429), erro do servidor (5xx) ou rede. O resto não passa sozinho.
+    if isinstance(e, gspread.exceptions.APIError): return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError))
+
+def contadores_api():
+    lim = get_limitador()
+    with lim["cond"]: return dict(lim["contadores"])
+
+TTL_CACHE = 300 # Cache de 5 minutos
+TTL_COMPLETO = 3600 # Releitura completa a cada hora; entre elas só o delta dos voluntários
+ANTECEDENCIA = 30 # O atualizador em segundo plano relê esses segundos antes do cache vencer
+JANELA_DIAS = int(config("JANELA_DIAS", 60)) # Eventos de até tantos dias atrás ficam no snapshot; 0 = todos
+
+def inicio_janela():
+    # Data a partir da qual os eventos entram no snapshot; os anteriores ficam no arquivo (espelho SQLite)
+    return date.today() - timedelta(days=JANELA_DIAS) if JANELA_DIAS > 0 else None
+
+def ler_planilha(inicio=None):
+    # Calendário e Usuários numa única chamada; as novas tentativas ficam com o limitador.
+    # Devolve (eventos da janela, usuários, eventos anteriores a `inicio` só com as datas convertidas).
+    resp = chamar_api("leitura", lambda: get_planilha().values_batch_get(["'Calendario_Eventos'", "'Usuarios'"]))
+    val_ev, val_us = [r.get("values", []) for r in resp["valueRanges"]]
+    m = get_metricas()
+    with m.medir("montar_df"): df_ev, df_us = montar_df(val_ev), montar_df(val_us, COLS_USUARIOS)
+    with m.medir("preparar_eventos"): quentes, arquivo = preparar_janela(df_ev, inicio)
+    return quentes, preparar_usuarios(df_us), arquivo
+
+@st.cache_resource
+def get_cache_dados():
+    # Uma cópia por servidor: as escritas corrigem só a linha afetada em vez de limpar o cache de todos
+    return {"df_ev": None, "df_us": None, "idx_email": {}, "agenda": {}, "versao": 0, "lido_em": 0.0, "completo_em": 0.0,
+            "falhou_em": 0.0, "releitura": False, "pedido_em": 0.0, "antigos": [], "motor": None, "n_linhas": 0, "inicio": None, "arquivo": None, "geracao": None, "seq": 0, "lock": threading.RLock(), "lock_vagas": threading.Lock(), "locks_linha": {}, "lock_carga": threading.RLock(),
+            "acordar": threading.Event()}
+
+def _letra_coluna(c):
+    return gspread.utils.rowcol_to_a1(1, c)[:-1]
+
+def sincronizar_delta(cache):
+    # Leitura barata numa só chamada: colunas que identificam o evento (A:C), de voluntários (H:I) e e-mails.
+    # Devolve True (cache em dia), False (a estrutura mudou: reler tudo) ou None (uma escrita entrou
+    # durante a leitura: tentar de novo em seguida). Cota e rede sobem como exceção: uma leitura completa
+    # logo depois só pioraria. Só as linhas da janela são comparadas; as arquivadas se atualizam na
+    # próxima leitura completa.
+    df_ev, df_us, versao = cache["df_ev"], cache["df_us"], cache["versao"]
+    c1, c2 = df_ev.columns.get_loc("Voluntário 1") + 1, df_ev.columns.get_loc("Voluntário 2") + 1
+    chaves = [df_ev.columns.get_loc(c) for c in CHAVES_EVENTO]
+    intervalos = [f"Calendario_Eventos!A2:{_letra_coluna(max(chaves) + 1)}", f"Calendario_Eventos!{_letra_coluna(c1)}2:{_letra_coluna(c2)}", "Usuarios!A2:A"]
+    try:
+        resp = chamar_api("leitura", lambda: get_planilha().values_batch_get(intervalos), tentativas=1)
+    except gspread.exceptions.APIError as e:
+        if erro_transitorio(e): raise
+        return False
+    ids, vols, emails = [r.get("values", []) for r in resp["valueRanges"]]
+    if len(ids) != cache["n_linhas"] or len(emails) != len(df_us): return False
+    # Mesma contagem não basta (uma linha apagada e outra acrescentada): cada linha do snapshot tem de
+    # continuar sendo o mesmo evento, e cada usuário o mesmo e-mail, senão os voluntários iriam para a linha errada
+    if [r[0] if r else "" for r in emails] != df_us['Email'].astype(str).tolist(): return False
+    for c in chaves:
+        col_nova = pd.Series([r[c] if len(r) > c else "" for r in ids], dtype=object).to_numpy()[df_ev.index]
+        if (df_ev.iloc[:, c].astype(str).to_numpy(dtype=object) != col_nova).any(): return False
+
+    largura = c2 - c1 + 1
+    novos = [(r + [""] * largura)[:largura] for r in vols] + [[""] * largura] * (len(ids) - len(vols))
+    with cache["lock"]:
+        # Uma escrita entrou durante a leitura: o delta pode estar mais velho que o cache; fica para a próxima
+        if cache["versao"] != versao or cache["df_ev"] is not df_ev: return None
+        mudou = False
+        for coluna, off in (("Voluntário 1", 0), ("Voluntário 2", largura - 1)):
+            col_nova = pd.Series([r[off] for r in novos], dtype=object).to_numpy()[df_ev.index] # índice = linha - 2
+            atual = df_ev[coluna].astype(str).to_numpy(dtype=object)
+            for pos in (atual != col_nova).nonzero()[0]:
+                _gravar_evento(cache, df_ev.index[pos], coluna, col_nova[pos]); mudou = True
+        if mudou: cache["versao"] += 1
+    return True
+
+# --- Espelho local (SQLite) ---
+# Cópia em disco das duas abas. Na partida o snapshot sai daqui, sem rede e mesmo com o Sheets fora do ar;
+# o atualizador em segundo plano segue puxando a planilha e as escritas são repetidas no espelho.
+# Processos na mesma máquina apontando para o mesmo arquivo compartilham o snapshot (ver Réplicas).
+ARQUIVO_ESPELHO = config("ESPELHO_ARQUIVO", "espelho_planilha.sqlite3")
+AUX_ESPELHO = {"Voluntário 1": "_v1_n", "Voluntário 2": "_v2_n", "Email": "_email_n"} # colunas de busca (normalizadas)
+
+@st.cache_resource
+def get_espelho():
+    # None se o arquivo não abre (pasta inexistente, sem permissão): sem espelho, o app segue só com a planilha
+    try:
+        con = sqlite3.connect(ARQUIVO_ESPELHO, check_same_thread=False, isolation_level=None, timeout=10)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        # Escritas de cada processo, em ordem; os outros aplicam as que ainda não viram (origem = processo)
+        con.execute("CREATE TABLE IF NOT EXISTS mudancas (seq INTEGER PRIMARY KEY AUTOINCREMENT, origem TEXT, tabela TEXT, linha INTEGER, valores TEXT, inserir INTEGER)")
+    except sqlite3.Error:
+        return None
+    return {"con": con, "lock": threading.Lock(), "origem": f"{os.getpid()}-{uuid.uuid4().hex[:8]}"}
+
+def _q(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+def _recriar_tabela(con, tabela, df, indices):
+    colunas = [c for c in df.columns if c != "_linha"]
+    con.execute(f"DROP TABLE IF EXISTS {tabela}")
+    con.execute(f"CREATE TABLE {tabela} (_linha INTEGER PRIMARY KEY, {', '.join(_q(c) + ' TEXT' for c in colunas)})")
+    linhas = zip(df["_linha"].astype(int).tolist(), *[df[c].astype(str).tolist() for c in colunas])
+    con.executemany(f"INSERT INTO {tabela} VALUES ({', '.join('?' * (len(colunas) + 1))})", linhas)
+    for col in indices: con.execute(f"CREATE INDEX ix_{tabela}{col} ON {tabela} ({_q(col)})")
+
+def _meta(con, **valores):
+    con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in valores.items()])
+
+def salvar_espelho(df_ev, df_us, lido_em, df_arquivo=None, seq_base=None):
+    # O espelho guarda o calendário inteiro: a janela do snapshot e as linhas arquivadas.
+    # Devolve a geração nova (None se o SQLite falhou); as outras réplicas recarregam quando ela muda.
+    todos = (df_ev if df_arquivo is None or df_arquivo.empty else pd.concat([df_ev, df_arquivo])).sort_index()
+    ev = todos[colunas_planilha(todos)].astype(str).assign(_linha=todos.index + 2, _data_iso=todos['Data_Dt'].dt.strftime('%Y-%m-%d').fillna(""))
+    ev = ev.assign(**{aux: ev[c].str.lower().str.strip() for c, aux in AUX_ESPELHO.items() if c in ev})
+    us = df_us.assign(_linha=df_us.index + 2, _email_n=df_us['Email'].map(email_norm))
+    esp = get_espelho()
+    if esp is None: return None
+    try:
+        with esp["lock"]:
+            con = esp["con"]
+            con.execute("BEGIN")
+            try:
+                _recriar_tabela(con, "eventos", ev, ["_data_iso"])
+                _recriar_tabela(con, "usuarios", us, ["_email_n"])
+                # Escritas registradas depois do início da leitura podem ter ficado de fora: refeitas nas tabelas novas
+                if seq_base is not None:
+                    for tabela, linha, valores, inserir in con.execute("SELECT tabela, linha, valores, inserir FROM mudancas WHERE seq > ? ORDER BY seq", (seq_base,)).fetchall():
+                        _aplicar_espelho(con, tabela, linha, json.loads(valores), inserir)
+                    con.execute("DELETE FROM mudancas WHERE seq <= ?", (seq_base,))
+                geracao = uuid.uuid4().hex
+                _meta(con, lido_em=lido_em, geracao=geracao)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK"); raise
+    except sqlite3.Error:
+        return None # sem espelho o app segue funcionando só com a planilha
+    return geracao
+
+def _do_espelho(df):
+    # Tabela do espelho -> DataFrame como o da planilha (índice = linha - 2, sem as colunas auxiliares)
+    df.index = (df.pop("_linha") - 2).rename(None)
+    return df.drop(columns=[c for c in df.columns if c.startswith("_")])
+
+def carregar_espelho(inicio=None):
+    # Só as linhas da janela (e as sem data); o total de linhas vai junto para o delta
+    esp = get_espelho()
+    if esp is None: return None
+    try:
+        with esp["lock"]:
+            con = esp["con"]
+            ev = pd.read_sql_query("SELECT * FROM eventos WHERE _data_iso >= ? OR _data_iso = '' ORDER BY _linha", con,
+                                   params=(inicio.isoformat() if inicio else "",))
+            n_linhas = con.execute("SELECT COUNT(*) FROM eventos").fetchone()[0]
+            us = pd.read_sql_query("SELECT * FROM usuarios ORDER BY _linha", con)
+            lido_em = float(con.execute("SELECT valor FROM meta WHERE chave = 'lido_em'").fetchone()[0])
+    except (sqlite3.Error, pd.errors.DatabaseError, TypeError):
+        return None
+    with get_metricas().medir("preparar_eventos"): return preparar_eventos(_do_espelho(ev)), preparar_usuarios(_do_espelho(us)), lido_em, n_linhas
+
+def carregar_arquivo_espelho(ini, fim):
+    # Eventos de [ini, fim) que ficaram fora da janela; None se o espelho não estiver disponível
+    esp = get_espelho()
+    if esp is None: return None
+    try:
+        with esp["lock"]:
+            ev = pd.read_sql_query("SELECT * FROM eventos WHERE _data_iso >= ? AND _data_iso < ? ORDER BY _linha", esp["con"],
+                                   params=(ini.isoformat(), fim.isoformat()))
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        return None
+    return preparar_eventos(_do_espelho(ev))
+
+def _aplicar_espelho(con, tabela, linha, valores, inserir=False):
+    valores = {c: str(v) for c, v in valores.items()}
+    for coluna, aux in AUX_ESPELHO.items():
+        if coluna in valores: valores[aux] = valores[coluna].lower().strip()
+    cols = list(valores)
+    if inserir:
+        con.execute(f"INSERT OR REPLACE INTO {tabela} (_linha, {', '.join(map(_q, cols))}) VALUES (?{', ?' * len(cols)})",
+                    [linha] + [valores[c] for c in cols])
+    else:
+        con.execute(f"UPDATE {tabela} SET {', '.join(_q(c) + ' = ?' for c in cols)} WHERE _linha = ?",
+                    [valores[c] for c in cols] + [linha])
+
+# Escritas no espelho numa thread própria: quem chama o espelho_gravar costuma estar com cache["lock"], e o
+# commit no SQLite (ou a espera por um salvar_espelho em curso) não pode segurar os reruns das sessões.
+@st.cache_resource
+def get_fila_espelho():
+    fila = {"itens": deque(), "cond": threading.Condition()}
+    threading.Thread(target=_gravar_espelho, args=(fila,), daemon=True, name="espelho").start()
+    return fila
+
+def espelho_gravar(tabela, linha, valores, inserir=False):
+    # valores: {coluna: valor}. Só enfileira, na ordem das escritas no cache.
+    fila = get_fila_espelho()
+    with fila["cond"]:
+        fila["itens"].append((tabela, linha, {c: str(v) for c, v in valores.items()}, inserir))
+        fila["cond"].notify()
+
+def _gravar_espelho(fila):
+    # O que juntou na fila entra numa transação só. Falha no SQLite não derruba nada; a planilha continua sendo a fonte.
+    while True:
+        with fila["cond"]:
+            while not fila["itens"]: fila["cond"].wait()
+            lote = list(fila["itens"]); fila["itens"].clear()
+        esp = get_espelho()
+        if esp is None: continue
+        try:
+            with esp["lock"]:
+                con = esp["con"]
+                con.execute("BEGIN")
+                try:
+                    for tabela, linha, valores, inserir in lote:
+                        _aplicar_espelho(con, tabela, linha, valores, inserir)
+                        con.execute("INSERT INTO mudancas (origem, tabela, linha, valores, inserir) VALUES (?, ?, ?, ?, ?)",
+                                    (esp["origem"], tabela, linha, json.dumps(valores, ensure_ascii=False), int(inserir)))
+                    con.execute("COMMIT")
+                except Exception:
+                    con.execute("ROLLBACK"); raise
+        except sqlite3.Error:
+            pass
+
+# Snapshot imutável: os DataFrames publicados em cache["df_ev"]/["df_us"] nunca são alterados. Cada
+# escrita publica uma versão nova (copy-on-write: só as colunas tocadas são copiadas) e as sessões
+# recebem vistas rasas do snapshot atual, sem cópia do calendário a cada rerun.
+def _publicar(cache, **frames):
+    # Chamar com cache["lock"]. A versão anterior sai do cache e é liberada quando a última sessão
+    # que ainda a usa termina o rerun; `antigos` só acompanha (weakref) quantas continuam vivas.
+    for chave, df in frames.items():
+        if cache[chave] is not None: cache["antigos"].append(weakref.ref(cache[chave]))
+        cache[chave] = df
+    cache["antigos"] = [r for r in cache["antigos"] if r() is not None]
+
+def snapshots_antigos_vivos():
+    cache = get_cache_dados()
+    with cache["lock"]: return sum(1 for r in cache["antigos"] if r() is not None)
+
+def _instalar_snapshot(cache, df_ev, df_us, lido_em, n_linhas, inicio, versao=None):
+    # Troca atômica do snapshot. Com `versao`, desiste se alguma escrita entrou depois dessa versão.
+    # n_linhas: linhas do calendário na planilha, contando as que ficaram fora da janela (`inicio`).
+    idx_email, agenda = indexar_usuarios(df_us), indexar_agenda(df_ev)
+    with cache["lock"]:
+        if versao is not None and cache["versao"] != versao and cache["df_ev"] is not None: return False
+        _publicar(cache, df_ev=df_ev, df_us=df_us)
+        # Releitura pedida depois do início desta leitura continua pendente
+        cache.update(idx_email=idx_email, agenda=agenda, lido_em=lido_em, completo_em=lido_em, releitura=cache["pedido_em"] > lido_em,
+                     n_linhas=n_linhas, inicio=inicio, arquivo=None)
+        cache["versao"] += 1
+    publicar_mudanca()
+    return True
+
+def atualizar_cache(completo=False):
+    # Stale-while-revalidate: a leitura da planilha acontece fora do lock e o snapshot novo
+    # entra de uma vez; enquanto isso as sessões continuam lendo o anterior.
+    cache = get_cache_dados()
+    with cache["lock_carga"]:
+        agora = time.time()
+        completo = (completo or cache["df_ev"] is None or agora - cache["completo_em"] > TTL_COMPLETO
+                    or cache["pedido_em"] > cache["completo_em"])
+        if not completo:
+            try:
+                em_dia = sincronizar_delta(cache)
+            except Exception:
+                cache["falhou_em"] = time.time(); raise
+            if em_dia is None:
+                cache["releitura"] = True; return # o atualizador tenta o delta de novo na próxima volta
+            if em_dia:
+                get_metricas().contar("atualizacao_delta")
+                cache["lido_em"] = agora; cache["releitura"] = False
+                espelho_meta(lido_em=agora); return
+        get_metricas().contar("atualizacao_completa")
+        versao, inicio, seq_base = cache["versao"], inicio_janela(), estado_espelho()["seq"]
+        try:
+            df_ev, df_us, df_arquivo = ler_planilha(inicio)
+        except Exception:
+            cache["falhou_em"] = time.time(); raise
+        with get_metricas().medir("espelho_salvar"): geracao = salvar_espelho(df_ev, df_us, agora, df_arquivo, seq_base)
+        if not _instalar_snapshot(cache, df_ev, df_us, agora, len(df_ev) + len(df_arquivo), inicio, versao):
+            cache["releitura"] = True; cache["acordar"].set() # escrita durante a leitura: relê em seguida
+        elif geracao:
+            # Mudanças de outras réplicas depois do início da leitura entram pelo acompanhamento do espelho
+            cache["geracao"], cache["seq"] = geracao, seq_base or 0
+
+# --- Réplicas ---
+# Vários processos do app na mesma máquina (atrás de um balanceador) compartilham o espelho. Só o líder,
+# eleito por flock, lê a planilha; todos conferem o espelho a cada INTERVALO_REPLICAS: geração nova
+# (leitura completa) -> recarregam o snapshot dele; mudanças de outros processos -> aplicam linha a linha.
+INTERVALO_REPLICAS = 0.5
+
+@st.cache_resource
+def get_lideranca():
+    return {"arquivo": None}
+
+def eh_lider():
+    # O lock é do processo e some com ele; o próximo que tentar assume a leitura da planilha
+    lid = get_lideranca()
+    if fcntl is None or lid["arquivo"] is not None: return True
+    try:
+        f = open(ARQUIVO_ESPELHO + ".lider", "a")
+    except OSError:
+        return True # sem arquivo não há espelho compartilhado: cada processo lê a planilha
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close(); return False
+    lid["arquivo"] = f
+    get_metricas().contar("lideranca_assumida")
+    return True
+
+def estado_espelho():
+    # {geracao, lido_em, releitura (pedido de releitura completa), seq (última mudança)}; vazio se o espelho falhar
+    esp, vazio = get_espelho(), {"geracao": None, "lido_em": 0.0, "releitura": 0.0, "seq": None}
+    if esp is None: return vazio
+    try:
+        with esp["lock"]:
+            meta = dict(esp["con"].execute("SELECT chave, valor FROM meta WHERE chave IN ('geracao', 'lido_em', 'releitura')").fetchall())
+            seq = esp["con"].execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'mudancas'), 0)").fetchone()[0]
+    except sqlite3.Error:
+        return vazio
+    return {"geracao": meta.get("geracao"), "lido_em": float(meta.get("lido_em", 0)), "releitura": float(meta.get("releitura", 0)), "seq": seq}
+
+def espelho_meta(**valores):
+    esp = get_espelho()
+    if esp is None: return
+    try:
+        with esp["lock"]: _meta(esp["con"], **valores)
+    except sqlite3.Error:
+        pass
+
+def _aplicar_mudanca(cache, tabela, linha, valores, inserir):
+    # Mudança gravada por outro processo: entra no snapshot deste sem voltar para o espelho
+    with cache["lock"]:
+        if tabela == "eventos":
+            df = cache["df_ev"]
+            if linha - 2 not in df.index: return # fora da janela
+            mudou = [_gravar_evento(cache, linha - 2, coluna, valor, espelho=False) for coluna, valor in valores.items() if coluna in df.columns]
+            if any(mudou): cache["versao"] += 1
+        else:
+            dados = [valores.get(c, "") for c in cache["df_us"].columns]
+            (adicionar_usuario_cache if inserir else atualizar_usuario_cache)(linha, dados, espelho=False)
+
+def acompanhar_espelho(cache):
+    # Traz para este processo o que os outros gravaram. Devolve o horário do último pedido de releitura.
+    est = estado_espelho()
+    if est["seq"] is None or cache["df_ev"] is None: return est["releitura"]
+    m = get_metricas()
+    if est["geracao"] and est["geracao"] != cache["geracao"]:
+        with cache["lock_carga"], m.medir("replica_recarga"):
+            inicio = inicio_janela()
+            espelho = carregar_espelho(inicio)
+            if espelho and _instalar_snapshot(cache, *espelho, inicio):
+                cache["geracao"], cache["seq"] = est["geracao"], est["seq"]
+                m.contar("replica_recarga")
+        return est["releitura"]
+    if est["seq"] > cache["seq"]:
+        # Até est["seq"]: o que outra réplica gravar depois disso fica para a próxima volta, não é pulado
+        esp = get_espelho()
+        try:
+            with esp["lock"]:
+                novas = esp["con"].execute("SELECT seq, tabela, linha, valores, inserir FROM mudancas WHERE seq > ? AND seq <= ? AND origem != ? ORDER BY seq",
+                                           (cache["seq"], est["seq"], esp["origem"])).fetchall()
+        except sqlite3.Error:
+            return est["releitura"]
+        for seq, tabela, linha, valores, inserir in novas:
+            _aplicar_mudanca(cache, tabela, linha, json.loads(valores), inserir)
+        cache["seq"] = est["seq"]
+        if novas: m.contar("replica_mudancas", len(novas))
+    if est["lido_em"] > cache["lido_em"]: cache["lido_em"] = est["lido_em"]
+    return est["releitura"]
+
+def _atualizar_em_segundo_plano(cache):
+    while True:
+        espera = cache["lido_em"] + TTL_CACHE - ANTECEDENCIA - time.time()
+        if cache["acordar"].wait(timeout=max(min(espera, INTERVALO_REPLICAS), 0.05)): cache["acordar"].clear()
+        try:
+            pedido = acompanhar_espelho(cache)
+        except Exception:
+            pedido = 0.0
+        if not eh_lider(): continue
+        if pedido > cache["completo_em"]: # releitura pedida por outra réplica
+            cache["completo_em"] = 0.0; cache["releitura"] = True; cache["pedido_em"] = max(cache["pedido_em"], pedido)
+        vencido = time.time() >= cache["lido_em"] + TTL_CACHE - ANTECEDENCIA
+        if cache["df_ev"] is None or not (vencido or cache["releitura"]): continue
+        try:
+            atualizar_cache()
+        except Exception:
+            time.sleep(30) # planilha fora do ar: segue servindo o último snapshot
+
+@st.cache_resource
+def get_atualizador():
+    t = threading.Thread(target=_atualizar_em_segundo_plano, args=(get_cache_dados(),), daemon=True)
+    t.start()
+    return t
+
+def load_data_cached():
+    cache, m = get_cache_dados(), get_metricas()
+    get_atualizador(); get_diario()
+    m.contar("cache_miss" if cache["df_ev"] is None else "cache_hit")
+    if cache["df_ev"] is None:
+        # Partida: usa o espelho local se existir (o atualizador relê a planilha se estiver velho);
+        # sem espelho, só a primeira carga do servidor espera pela planilha
+        try:
+            with cache["lock_carga"]:
+                if cache["df_ev"] is None:
+                    inicio, est = inicio_janela(), estado_espelho()
+                    espelho = carregar_espelho(inicio)
+                    if espelho:
+                        _instalar_snapshot(cache, *espelho, inicio); cache["acordar"].set(); m.contar("partida_espelho")
+                        cache["geracao"], cache["seq"] = est["geracao"], est["seq"] or 0
+                    else: atualizar_cache(completo=True)
+        except (gspread.exceptions.APIError, gspread.exceptions.WorksheetNotFound):
+            st.error("O Google Sheets está ocupado. Aguarde 30 segundos e atualize a página.")
+            st.stop()
+    # Vistas rasas do snapshot compartilhado: com copy-on-write, o que a sessão alterar fica só nela
+    with cache["lock"]:
+        return cache["df_ev"].copy(deep=False), cache["df_us"].copy(deep=False)
+
+def eventos_arquivo(data_ini):
+    # Eventos anteriores à janela, carregados do espelho só quando alguém escolhe uma data mais antiga.
+    # Fica guardado o maior intervalo já pedido desde a última leitura completa; None se a data está na janela.
+    cache = get_cache_dados()
+    with cache["lock"]: inicio, completo_em, arq = cache["inicio"], cache["completo_em"], cache["arquivo"]
+    if inicio is None or data_ini >= inicio: return None
+    if arq and arq[0] == completo_em and arq[1] <= data_ini: return arq[2]
+    get_metricas().contar("arquivo_carga")
+    with get_metricas().medir("arquivo_carregar"): df = carregar_arquivo_espelho(data_ini, inicio)
+    if df is None: return None
+    with cache["lock"]:
+        if cache["completo_em"] == completo_em: cache["arquivo"] = (completo_em, data_ini, df)
+    return df
+
+def idade_dados():
+    # (segundos desde a última leitura bem-sucedida, se a última tentativa falhou)
+    cache = get_cache_dados()
+    return time.time() - cache["lido_em"], cache["falhou_em"] > cache["lido_em"]
+
+def buscar_usuario(email):
+    cache = get_cache_dados()
+    with cache["lock"]: achado = cache["idx_email"].get(email_norm(email))
+    return (achado[0], dict(achado[1])) if achado else None
+
+def evento_atual(idx):
+    # Linha mais recente do evento no cache do servidor (índice = linha da planilha - 2)
+    cache = get_cache_dados()
+    with cache["lock"]: return cache["df_ev"].loc[idx].copy()
+
+def _reindexar_agenda(cache, df, idx, nomes):
+    atuais = {df.at[idx, norm] for norm in COLS_VOLUNTARIOS.values()}
+    for nome in set(nomes) - {""}:
+        linhas = cache["agenda"].setdefault(nome, {}).setdefault(slot(df, idx), set())
+        if nome in atuais: linhas.add(idx)
+        else: linhas.discard(idx)
+
+def conflito_agenda(nome_norm, data, horario):
+    # Índice de um evento do voluntário no mesmo dia/horário, ou None
+    cache = get_cache_dados()
+    with cache["lock"]: return conflito(cache["agenda"], nome_norm, data, horario)
+
+def motor_filtros():
+    # Um motor por snapshot: quando entra uma versão nova, o anterior (e o LRU dele) é descartado
+    cache = get_cache_dados()
+    with cache["lock"]:
+        if cache["motor"] is None or cache["motor"].df is not cache["df_ev"]:
+            cache["motor"] = MotorFiltros(cache["df_ev"], cache["versao"])
+        return cache["motor"]
+
+def minhas_inscricoes(nome_norm):
+    cache = get_cache_dados()
+    with cache["lock"]: return inscricoes(cache["agenda"], nome_norm)
+
+# Feed de mudanças: cada troca de voluntário publica o índice do evento; as sessões abertas conferem
+# a cada INTERVALO_VAGAS e só reroda a página quem tem na tela um card que mudou.
+INTERVALO_VAGAS = 5
+TAM_FEED = 1000 # Sessão que ficou mais atrás que isso confere todos os cards visíveis
+
+@st.cache_resource
+def get_feed():
+    return {"seq": 0, "itens": deque(maxlen=TAM_FEED), "lock": threading.Lock()}
+
+def publicar_mudanca(idx=None):
+    # idx None: snapshot novo inteiro (releitura completa ou recarga do espelho)
+    feed = get_feed()
+    with feed["lock"]:
+        feed["seq"] += 1
+        feed["itens"].append((feed["seq"], idx))
+
+def mudancas_desde(seq):
+    # (seq atual, índices que mudaram depois de `seq`); None no lugar dos índices = qualquer um pode ter mudado
+    feed = get_feed()
+    with feed["lock"]:
+        atual, itens = feed["seq"], feed["itens"]
+        if seq >= atual: return atual, set()
+        if not itens or itens[0][0] > seq + 1: return atual, None
+        mudados = {idx for s, idx in itens if s > seq}
+    return atual, None if None in mudados else mudados
+
+def vagas_evento(idx):
+    # Voluntários normalizados do evento no snapshot atual (o que o card mostra), ou None se saiu da janela
+    cache = get_cache_dados()
+    with cache["lock"]:
+        df = cache["df_ev"]
+        return (df.at[idx, 'V1_N'], df.at[idx, 'V2_N']) if df is not None and idx in df.index else None
+
+def invalidar_cache():
+    # Pede uma releitura completa ao atualizador em segundo plano (substitui o antigo st.cache_data.clear())
+    get_metricas().contar("invalidacoes_cache")
+    cache = get_cache_dados()
+    with cache["lock"]: cache["completo_em"] = 0.0; cache["releitura"] = True; cache["pedido_em"] = time.time()
+    espelho_meta(releitura=time.time()) # numa réplica seguidora, quem relê é o líder
+    cache["acordar"].set()
+
+ESPERA_SINCRONIZACAO = 20 # Segundos que o botão Sincronizar espera pelo snapshot novo
+
+def sincronizar():
+    # Botão Sincronizar: pede a releitura ao atualizador (cliques juntos viram uma leitura só, e numa
+    # réplica seguidora quem lê é o líder) e espera o snapshot novo. False se falhou ou demorou demais.
+    cache, pedido = get_cache_dados(), time.time()
+    invalidar_cache()
+    while time.time() < pedido + ESPERA_SINCRONIZACAO:
+        if cache["completo_em"] >= pedido: return True
+        if cache["falhou_em"] >= pedido: return False
+        time.sleep(0.2)
+    return False
+
+def _gravar_celula(df, idx, coluna, valor):
+    # Categórica ganha a categoria nova; os outros tipos viram object para aceitar qualquer valor
+    if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+        if valor not in df[coluna].cat.categories: df[coluna] = df[coluna].cat.add_categories([valor])
+    elif df[coluna].dtype != object: df[coluna] = df[coluna].astype(object)
+    df.at[idx, coluna] = valor
+
+def _gravar_evento(cache, idx, coluna, valor, espelho=True):
+    # False (sem versão nova, feed nem espelho) se a célula já tem esse valor
+    if str(cache["df_ev"].at[idx, coluna]) == str(valor): return False
+    df = cache["df_ev"].copy(deep=False)
+    _gravar_celula(df, idx, coluna, valor)
+    if coluna in COLS_VOLUNTARIOS:
+        norm = COLS_VOLUNTARIOS[coluna]; anterior = df.at[idx, norm]
+        _gravar_celula(df, idx, norm, str(valor).lower().strip())
+        _reindexar_agenda(cache, df, idx, (anterior, df.at[idx, norm]))
+        _gravar_celula(df, idx, 'Card_HTML', montar_card(df.loc[idx]))
+    _publicar(cache, df_ev=df)
+    if coluna in COLS_VOLUNTARIOS: publicar_mudanca(idx)
+    if espelho: espelho_gravar("eventos", idx + 2, {coluna: valor})
+    return True
+
+# Write-through: aplicado depois que a escrita na planilha deu certo
+def atualizar_evento_cache(linha, col_idx, valor):
+    cache = get_cache_dados()
+    with cache["lock"]:
+        df = cache["df_ev"]
+        if df is None or linha - 2 not in df.index: return invalidar_cache()
+        if _gravar_evento(cache, linha - 2, df.columns[col_idx - 1], valor): cache["versao"] += 1
+
+def atualizar_usuario_cache(linha, dados, espelho=True):
+    cache = get_cache_dados()
+    with cache["lock"]:
+        if cache["df_us"] is None or not 0 <= linha - 2 < len(cache["df_us"]): return invalidar_cache()
+        df = cache["df_us"].copy(deep=False)
+        for coluna, valor in zip(df.columns, dados): _gravar_celula(df, linha - 2, coluna, valor)
+        _publicar(cache, df_us=df)
+        if espelho: espelho_gravar("usuarios", linha, dict(zip(df.columns, dados)))
+        cache["idx_email"][email_norm(dados[0])] = (linha - 2, registro_usuario(df.loc[linha - 2].to_dict()))
+        cache["versao"] += 1
+
+def adicionar_usuario_cache(linha, dados, espelho=True):
+    # linha: onde o values_append gravou; se não for logo após o que temos, outra instância escreveu antes
+    cache = get_cache_dados()
+    with cache["lock"]:
+        if cache["df_us"] is None or linha - 2 != len(cache["df_us"]): return invalidar_cache()
+        df = cache["df_us"].copy(deep=False)
+        df.loc[linha - 2] = (list(dados) + [""] * len(df.columns))[:len(df.columns)]
+        _publicar(cache, df_us=preparar_usuarios(df)) # a linha nova desfaz as categóricas; cadastro é raro
+        if espelho: espelho_gravar("usuarios", linha, df.loc[linha - 2].to_dict(), inserir=True)
+        cache["idx_email"].setdefault(email_norm(dados[0]), (linha - 2, registro_usuario(df.loc[linha - 2].to_dict())))
+        cache["versao"] += 1
+
+# Fila de escrita do servidor: junta as escritas de todas as sessões e manda num só
+# values_batch_update (+ um values_append por aba) a cada JANELA_ESCRITA segundos.
+JANELA_ESCRITA = 0.3
+
+@st.cache_resource
+def get_fila_escrita():
+    fila = {"pendentes": [], "cond": threading.Condition()}
+    threading.Thread(target=_processar_fila, args=(fila,), daemon=True).start()
+    return fila
+
+def enfileirar_escrita(aba, valores, intervalo=None):
+    # intervalo=None acrescenta uma linha no fim da aba. O Future resolve com o nº da linha gravada.
+    fila = get_fila_escrita(); fut = Future()
+    with fila["cond"]:
+        fila["pendentes"].append((aba, intervalo, valores, fut))
+        fila["cond"].notify()
+    return fut
+
+def _processar_fila(fila):
+    while True:
+        with fila["cond"]:
+            while not fila["pendentes"]: fila["cond"].wait()
+        time.sleep(JANELA_ESCRITA)
+        with fila["cond"]:
+            lote, fila["pendentes"] = fila["pendentes"], []
+
+        # Mesma célula/intervalo escrito duas vezes no lote: vale a última escrita
+        updates, appends = {}, {}
+        for aba, intervalo, valores, fut in lote:
+            if intervalo is None: appends.setdefault(aba, []).append((valores, fut))
             else:
-                st.error("O Google Sheets está ocupado. Aguarde 30 segundos e atualize a página.")
-                st.stop()
+                anterior = updates.pop((aba, intervalo), (None, []))
+                updates[(aba, intervalo)] = (valores, anterior[1] + [fut])
 
-def get_sheets():
-    # Sem cache para operações de escrita (Update)
-    client = get_gspread_client()
-    ss = client.open_by_key("1paP1ZB2ufwCc95T_gdCR92kx-suXbROnDfbWMC_ka0c")
-    return ss.worksheet("Calendario_Eventos"), ss.worksheet("Usuarios")
+        try:
+            ss = get_planilha()
+        except Exception as e:
+            for *_, fut in lote: fut.set_exception(e)
+            continue
+
+        if updates:
+            corpo = {"valueInputOption": "RAW", "data": [{"range": f"'{aba}'!{intervalo}", "values": valores} for (aba, intervalo), (valores, _) in updates.items()]}
+            try:
+                chamar_api("escrita", lambda: ss.values_batch_update(corpo))
+                for (aba, intervalo), (_, futs) in updates.items():
+                    linha = int(re.search(r"\d+", intervalo).group())
+                    for fut in futs: fut.set_result(linha)
+            except Exception as e:
+                for _, futs in updates.values():
+                    for fut in futs: fut.set_exception(e)
+
+        for aba, itens in appends.items():
+            params = {"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"}
+            try:
+                resp = chamar_api("escrita", lambda: ss.values_append(f"'{aba}'!A1", params, {"values": [v for v, _ in itens]}))
+                inicio = int(re.search(r"![A-Z]+(\d+)", resp["updates"]["updatedRange"]).group(1))
+                for i, (_, fut) in enumerate(itens): fut.set_result(inicio + i)
+            except Exception as e:
+                for _, fut in itens: fut.set_exception(e)
+
+CHAVES_EVENTO = ("Nome do Evento", "Data Específica", "Horario") # identificam o evento de uma linha
+
+def reservar_vaga(linha, row, col_pref, nome):
+    # Compare-and-set: relê só a linha do evento, grava se a vaga ainda estiver livre
+    # (ou cai para a outra vaga) e confere depois da escrita.
+    # Retorna "ok", "cheio" (outra pessoa pegou a vaga) ou "mudou" (a linha não é mais esse evento).
+    cache = get_cache_dados()
+    colunas = list(cache["df_ev"].columns)
+    c1, c2 = colunas.index("Voluntário 1") + 1, colunas.index("Voluntário 2") + 1
+    # Um lock por linha: inscrições em eventos diferentes esperam juntas e saem no mesmo lote do escritor.
+    with cache["lock_vagas"]:
+        lock_linha = cache["locks_linha"].setdefault(linha, threading.Lock())
+    with lock_linha:
+        sheet_ev, _ = get_sheets()
+        atual = (chamar_api("escrita", lambda: sheet_ev.get(f"A{linha}:{_letra_coluna(max(c1, c2))}{linha}"), cota="leitura") or [[]])[0]
+        atual = [str(v).strip() for v in atual] + [""] * (len(colunas) - len(atual))
+        for chave in CHAVES_EVENTO:
+            if atual[colunas.index(chave)] != str(row[chave]).strip():
+                invalidar_cache(); return "mudou"
+
+        v1, v2 = atual[c1 - 1], atual[c2 - 1]
+        atualizar_evento_cache(linha, c1, v1); atualizar_evento_cache(linha, c2, v2)
+        if nome.lower().strip() in (v1.lower(), v2.lower()): return "ok"
+        livres = [c for c, v in ((c1, v1), (c2, v2)) if v == ""]
+        if not livres: return "cheio"
+        col_idx = col_pref if col_pref in livres else livres[0]
+
+        enfileirar_escrita("Calendario_Eventos", [[nome]], f"{_letra_coluna(col_idx)}{linha}").result()
+        gravado = str(chamar_api("escrita", lambda: sheet_ev.cell(linha, col_idx), cota="leitura").value or "").strip()
+        atualizar_evento_cache(linha, col_idx, gravado)
+        return "ok" if gravado == nome.strip() else "cheio"
+
+# --- Diário de escritas (SQLite) ---
+# Inscrições, cadastros e edições vão primeiro para um diário local (fsync a cada commit) e a sessão segue
+# na hora. Um reaplicador em segundo plano leva as entradas à planilha, esperando cada vez mais enquanto o
+# Sheets falha (cota, rede). A ordem vale dentro de cada grupo (a linha do evento ou o e-mail do cadastro);
+# grupos diferentes andam juntos e as escritas deles saem no mesmo lote da fila de escrita.
+# Só o processo líder reaplica (ver Réplicas).
+ARQUIVO_DIARIO = config("DIARIO_ARQUIVO", "diario_escritas.sqlite3")
+INTERVALO_DIARIO = 1.0
+MAX_TENTATIVAS_DIARIO = 50 # Falhas transitórias seguidas; depois disso a entrada fica como "falhou" e as seguintes andam
+RETENCAO_DIARIO = 7 * 86400 # Entradas terminadas ficam uma semana no arquivo
+GRUPOS_DIARIO = 8 # Grupos reaplicados ao mesmo tempo
+PENDENTE = "pendente"
+
+@st.cache_resource
+def get_diario():
+    # None se o arquivo não abre: sem diário, inscrições, cadastros e edições vão direto para a planilha
+    try:
+        con = sqlite3.connect(ARQUIVO_DIARIO, check_same_thread=False, isolation_level=None, timeout=10)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=FULL")
+        con.execute("CREATE TABLE IF NOT EXISTS diario (id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT, chave TEXT, dados TEXT, criado_em REAL, "
+                    "estado TEXT, tentativas INTEGER DEFAULT 0, proxima REAL DEFAULT 0, resultado TEXT, feito_em REAL)")
+        con.execute("CREATE INDEX IF NOT EXISTS ix_diario_estado ON diario (estado, id)")
+        con.execute("CREATE INDEX IF NOT EXISTS ix_diario_chave ON diario (chave)")
+        d = {"con": con, "lock": threading.Lock(), "entradas": {}, "acordar": threading.Event(),
+             "grupos": ThreadPoolExecutor(GRUPOS_DIARIO, thread_name_prefix="diario-grupo"), "em_curso": set()}
+        _ler_diario(d)
+    except sqlite3.Error:
+        return None
+    threading.Thread(target=_reaplicar_diario, args=(d,), daemon=True, name="diario").start()
+    return d
+
+def _ler_diario(d):
+    # Cópia em memória das entradas pendentes e das terminadas há pouco; as sessões consultam só ela.
+    # Leitura e troca sob o mesmo lock do registrar_no_diario: uma entrada nova nunca some da cópia.
+    with d["lock"]:
+        linhas = d["con"].execute("SELECT id, tipo, dados, estado, resultado FROM diario WHERE estado = ? OR feito_em > ?",
+                                  (PENDENTE, time.time() - 600)).fetchall()
+        d["entradas"] = {i: {"tipo": t, "dados": json.loads(v), "estado": e, "resultado": r} for i, t, v, e, r in linhas}
+
+def registrar_no_diario(tipo, chave, dados):
+    # Id da entrada (a pendente com a mesma chave, em clique repetido); None se o diário falhou
+    d = get_diario()
+    if d is None: return None
+    try:
+        with d["lock"]:
+            igual = d["con"].execute("SELECT id FROM diario WHERE chave = ? AND estado = ?", (chave, PENDENTE)).fetchone()
+            if igual: return igual[0]
+            id_ = d["con"].execute("INSERT INTO diario (tipo, chave, dados, criado_em, estado) VALUES (?, ?, ?, ?, ?)",
+                                   (tipo, chave, json.dumps(dados, ensure_ascii=False), time.time(), PENDENTE)).lastrowid
+            d["entradas"] = {**d["entradas"], id_: {"tipo": tipo, "dados": dados, "estado": PENDENTE, "resultado": None}}
+    except sqlite3.Error:
+        return None
+    d["acordar"].set()
+    get_metricas().contar(f"diario_{tipo}")
+    return id_
+
+def _entradas_diario():
+    d = get_diario()
+    return {} if d is None else d["entradas"]
+
+def entrada_diario(id_):
+    return _entradas_diario().get(id_)
+
+def diario_pendentes():
+    return sum(1 for e in _entradas_diario().values() if e["estado"] == PENDENTE)
+
+def inscricoes_pendentes(nome_norm):
+    # Índices dos eventos com inscrição do voluntário ainda no diário
+    return {e["dados"]["linha"] - 2 for e in _entradas_diario().values()
+            if e["tipo"] == "inscricao" and e["estado"] == PENDENTE and e["dados"]["nome"].lower().strip() == nome_norm}
+
+def usuario_atual(email):
+    # buscar_usuario com o cadastro/edição ainda no diário por cima (o voluntário vê os próprios dados na hora)
+    achado = buscar_usuario(email)
+    for _, e in sorted(_entradas_diario().items()):
+        if e["tipo"] in ("cadastro", "edicao") and e["estado"] == PENDENTE and email_norm(e["dados"][0]) == email_norm(email):
+            achado = (achado[0] if achado else None, registro_usuario(dict(zip(COLS_USUARIOS, e["dados"]))))
+    return achado
+
+def _aplicar_entrada(tipo, dados):
+    # Idempotente: reaplicar depois de uma queda não duplica inscrição nem cadastro
+    if tipo == "inscricao":
+        return reservar_vaga(dados["linha"], dados["evento"], dados["coluna"], dados["nome"])
+    achado = buscar_usuario(dados[0])
+    if tipo == "cadastro":
+        if achado: return "ok"
+        # O snapshot pode ter vindo de um espelho sem a linha (queda depois do append e antes de marcar
+        # a entrada): confere a coluna de e-mails na planilha antes de acrescentar
+        emails = chamar_api("escrita", lambda: get_planilha().values_get("'Usuarios'!A2:A"), cota="leitura").get("values", [])
+        linha = next((i for i, r in enumerate(emails, start=2) if r and email_norm(r[0]) == email_norm(dados[0])), None)
+        if linha is None: linha = enfileirar_escrita("Usuarios", dados).result()
+        adicionar_usuario_cache(linha, dados); return "ok"
+    if not achado: return "sem_cadastro"
+    linha = achado[0] + 2
+    enfileirar_escrita("Usuarios", [dados], f"A{linha}:E{linha}").result()
+    atualizar_usuario_cache(linha, dados); return "ok"
+
+def _grupo_entrada(tipo, dados):
+    return ("linha", dados["linha"]) if tipo == "inscricao" else ("email", email_norm(dados[0]))
+
+def _reaplicar_pendentes(d):
+    # Cada grupo numa thread, sem esperar os outros: uma inscrição que chega enquanto outra espera a fila de
+    # escrita entra no mesmo lote. Grupo já em curso fica para quando ele terminar. Devolve os Futures.
+    with d["lock"]: # consulta e em_curso juntos: o grupo marca as entradas e sai do em_curso sob o mesmo lock
+        fila = d["con"].execute("SELECT id, tipo, dados, tentativas, proxima FROM diario WHERE estado = ? ORDER BY id", (PENDENTE,)).fetchall()
+        grupos = {}
+        for id_, tipo, dados, tentativas, proxima in fila:
+            dados = json.loads(dados)
+            grupos.setdefault(_grupo_entrada(tipo, dados), []).append((id_, tipo, dados, tentativas, proxima))
+        grupos = {chave: g for chave, g in grupos.items() if chave not in d["em_curso"]}
+        d["em_curso"].update(grupos)
+        d["con"].execute("DELETE FROM diario WHERE estado != ? AND feito_em < ?", (PENDENTE, time.time() - RETENCAO_DIARIO))
+    return [d["grupos"].submit(_reaplicar_grupo, d, chave, g) for chave, g in grupos.items()]
+
+def _reaplicar_grupo(d, chave, grupo):
+    try:
+        if _reaplicar_entradas(d, grupo): d["acordar"].set() # o que chegou para o grupo enquanto ele andava
+    finally:
+        with d["lock"]: d["em_curso"].discard(chave)
+
+def _reaplicar_entradas(d, grupo):
+    # True se o grupo terminou; False se uma entrada ficou esperando (e segura as seguintes do grupo)
+    m = get_metricas()
+    for id_, tipo, dados, tentativas, proxima in grupo:
+        if proxima > time.time(): return False
+        try:
+            with m.medir("diario_reaplicar"): resultado, estado = _aplicar_entrada(tipo, dados), "aplicado"
+        except Exception as e:
+            tentativas += 1; m.contar("diario_falha")
+            # Só cota/servidor/rede esperam (segurando o grupo); erro permanente sai da frente na hora
+            if erro_transitorio(e) and tentativas < MAX_TENTATIVAS_DIARIO:
+                espera = min(300, 2 ** tentativas) * random.uniform(0.5, 1)
+                with d["lock"]: d["con"].execute("UPDATE diario SET tentativas = ?, proxima = ? WHERE id = ?", (tentativas, time.time() + espera, id_))
+                return False
+            resultado, estado = "erro", "falhou"
+        with d["lock"]:
+            d["con"].execute("UPDATE diario SET estado = ?, resultado = ?, tentativas = ?, feito_em = ? WHERE id = ?",
+                             (estado, resultado, tentativas, time.time(), id_))
+        m.contar(f"inscricao_{resultado}" if tipo == "inscricao" else f"diario_{tipo}_{resultado}")
+    return True
+
+def _reaplicar_diario(d):
+    cache = get_cache_dados()
+    while True:
+        if d["acordar"].wait(timeout=INTERVALO_DIARIO): d["acordar"].clear()
+        try:
+            if cache["df_ev"] is not None and eh_lider(): _reaplicar_pendentes(d)
+            _ler_diario(d)
+        except sqlite3.Error:
+            pass
 
 # --- 2. CONFIGURAÇÕES ---
-cores_niveis = {
-    "Nenhum": "#FFFFFF", "BAS": "#C8E6C9", "AV1": "#FFCDD2", "IN": "#BBDEFB",
-    "AV2": "#795548", "AV2-24": "#795548", "AV2-23": "#795548", "AV2/": "#795548",
-    "AV3": "#E1BEE7", "AV3A": "#E1BEE7", "AV3/": "#E1BEE7", "AV4": "#FFF9C4", "AV4A": "#FFF9C4"
-}
-mapa_niveis_num = {k: i for i, k in enumerate(cores_niveis.keys())}
-dias_semana = {"Monday": "Seg", "Tuesday": "Ter", "Wednesday": "Qua", "Thursday": "Qui", "Friday": "Sex", "Saturday": "Sáb", "Sunday": "Dom"}
+TAM_PAGINA = 20 # Cards por página na listagem ("Carregar mais" mostra a próxima)
 
-# --- 3. DIALOGS ---
+# --- 3. DIALOGS / FRAGMENTOS ---
 @st.dialog("Conflito de Agenda")
 def conflito_dialog(evento_nome, horario):
     st.warning("⚠️ **Você já possui uma atividade neste horário!**")
@@ -87,25 +979,209 @@ def confirmar_edicao_dialog(linha, novos_dados):
     st.markdown(f"**Nome:** {novos_dados[1]}\n**Telefone:** {novos_dados[2]}\n**Nível:** {novos_dados[4]}\n**Departamentos:** {novos_dados[3]}")
     st.info("Ao confirmar, o app será atualizado.")
     if st.button("Confirmar e Salvar", type="primary", width="stretch"):
-        _, sheet_us = get_sheets()
-        sheet_us.update(f"A{linha}:E{linha}", [novos_dados])
-        st.session_state.user = {"Email": novos_dados[0], "Nome": novos_dados[1], "Telefone": novos_dados[2], "Departamentos": novos_dados[3], "Nivel": novos_dados[4]}
+        if registrar_no_diario("edicao", None, novos_dados) is None: # diário indisponível: grava direto
+            if linha is None: # o cadastro ainda não chegou à planilha; sem a linha não há onde gravar
+                st.error("Seu cadastro ainda está sendo salvo. Tente alterar de novo em alguns minutos."); return
+            try:
+                enfileirar_escrita("Usuarios", [novos_dados], f"A{linha}:E{linha}").result()
+            except (gspread.exceptions.APIError, gspread.exceptions.WorksheetNotFound):
+                st.error("Não foi possível salvar agora. Tente de novo em alguns segundos."); return
+            atualizar_usuario_cache(linha, novos_dados)
+        st.session_state.user = registro_usuario({"Email": novos_dados[0], "Nome": novos_dados[1], "Telefone": novos_dados[2], "Departamentos": novos_dados[3], "Nivel": novos_dados[4]})
         st.session_state.modo_edicao = False
-        st.cache_data.clear(); st.success("Atualizado!"); st.rerun()
-
-@st.dialog("Confirmar Inscrição")
-def confirmar_dialog(linha, row, col_idx):
-    dia_pt = dias_semana.get(row['Data_Dt'].strftime('%A'), "")
-    st.markdown(f"### {row['Nível']} - {row['Nome do Evento']}")
-    st.write(f"📅 **Data:** {dia_pt} - {row['Data_Dt'].strftime('%d/%m/%Y')}")
-    st.write(f"⏰ **Horário:** {row['Horario']} | 🏢 **Depto:** {row['Departamento']}")
-    st.divider()
-    if st.button("Confirmar Inscrição", type="primary", width="stretch"):
-        with st.spinner("Salvando..."):
-            sheet_ev, _ = get_sheets()
-            sheet_ev.update_cell(linha, col_idx, st.session_state.user['Nome'])
-            st.cache_data.clear()
-            st.rerun()
+        st.success("Atualizado!"); st.rerun()
+
+# Inscrição confirmada dentro do próprio card (fragmento): só esse card é refeito.
+# Um st.dialog só fecha com rerun do app inteiro, por isso a confirmação não é mais um dialog.
+def _evento_exibido(row):
+    return {k: str(row[k]).strip() for k in CHAVES_EVENTO}
+
+def _pedir_inscricao(idx, nome_norm, exibido):
+    # exibido: o evento que o card mostrava no clique. Se a linha mudou de evento (ou sumiu) num
+    # recarregamento, a inscrição não segue para a linha errada.
+    try:
+        row = evento_atual(idx)
+    except KeyError:
+        st.session_state[f"ins_{idx}"] = "mudou"; return
+    if _evento_exibido(row) != exibido:
+        st.session_state[f"ins_{idx}"] = "mudou"; return
+    st.session_state[f"alvo_{idx}"] = exibido
+    conflito = conflito_agenda(nome_norm, row['Data Específica'], row['Horario'])
+    if conflito is None: # inscrição no mesmo dia/horário ainda no diário
+        alvo = (row['Data Específica'], row['Horario'])
+        conflito = next((i for i in inscricoes_pendentes(nome_norm) if i != idx and tuple(evento_atual(i)[['Data Específica', 'Horario']]) == alvo), None)
+    st.session_state[f"ins_{idx}"] = ("conflito", conflito) if conflito is not None else "confirmar"
+    if conflito is None: st.session_state.setdefault("confirmando", set()).add(idx)
+
+def _confirmar_inscricao(idx):
+    # O evento esperado é o que estava na caixa de confirmação, não o que a linha tem agora
+    alvo = st.session_state.pop(f"alvo_{idx}", None)
+    try:
+        row = evento_atual(idx)
+    except KeyError:
+        row = None
+    if alvo is None or row is None or _evento_exibido(row) != alvo:
+        get_metricas().contar("inscricao_mudou")
+        st.session_state[f"ins_{idx}"] = "mudou"; return
+    c_alvo = 8 if str(row['Voluntário 1']).strip() == "" else 9
+    nome, linha = st.session_state.user['Nome'], int(idx) + 2
+    # A inscrição vai para o diário e o card mostra "salvando" na hora; o resultado chega pelo acompanhar_vagas
+    dados = {"linha": linha, "coluna": c_alvo, "nome": nome, "evento": alvo}
+    id_ = registrar_no_diario("inscricao", f"inscricao:{linha}:{nome.lower().strip()}", dados)
+    if id_ is not None:
+        st.session_state.setdefault("diario", {})[idx] = id_; return
+    try: # diário indisponível: grava direto na planilha
+        resultado = reservar_vaga(linha, alvo, c_alvo, nome)
+    except gspread.exceptions.APIError:
+        resultado = "erro"
+    get_metricas().contar(f"inscricao_{resultado}")
+    if resultado != "ok": st.session_state[f"ins_{idx}"] = resultado
+
+msgs_inscricao = {
+    "cheio": "Essa vaga acabou de ser preenchida por outra pessoa.",
+    "erro": "Não foi possível salvar agora. Tente de novo em alguns segundos.",
+    "mudou": "A planilha foi alterada. Sincronize e tente de novo.",
+}
+
+@st.fragment
+def card_evento(idx, nome_u_comp):
+    try:
+        row = evento_atual(idx)
+    except KeyError:
+        return # a linha saiu num recarregamento entre o filtro e o card
+    estado = st.session_state.pop(f"ins_{idx}", None)
+    if estado != "confirmar": st.session_state.get("confirmando", set()).discard(idx)
+    st.session_state.setdefault("vistos", {})[idx] = (row['V1_N'], row['V2_N'])
+    v1, v2 = str(row['Voluntário 1']).strip(), str(row['Voluntário 2']).strip()
+    st.markdown(row['Card_HTML'], unsafe_allow_html=True)
+
+    ja_in = (v1.lower() == nome_u_comp or v2.lower() == nome_u_comp)
+    if ja_in: st.button("✅ INSCRITO", key=f"bi_{idx}", disabled=True, width="stretch")
+    elif idx in inscricoes_pendentes(nome_u_comp): st.button("⏳ INSCRIÇÃO SENDO SALVA", key=f"bp_{idx}", disabled=True, width="stretch")
+    elif v1 and v2: st.button("🚫 CHEIO", key=f"bf_{idx}", disabled=True, width="stretch")
+    elif estado == "confirmar":
+        with st.container(border=True):
+            dia_pt = dias_semana.get(row['Data_Dt'].strftime('%A'), "")
+            st.markdown(f"**Confirmar inscrição em {row['Nível']} - {row['Nome do Evento']}?**")
+            st.write(f"📅 **Data:** {dia_pt} - {row['Data_Dt'].strftime('%d/%m/%Y')} | ⏰ **Horário:** {row['Horario']} | 🏢 **Depto:** {row['Departamento']}")
+            c1, c2 = st.columns(2)
+            c1.button("Confirmar Inscrição", key=f"bc_{idx}", type="primary", width="stretch", on_click=_confirmar_inscricao, args=(idx,))
+            c2.button("Cancelar", key=f"bx_{idx}", width="stretch")
+    else:
+        st.button("Quero me inscrever", key=f"bq_{idx}", type="primary", width="stretch", on_click=_pedir_inscricao, args=(idx, nome_u_comp, _evento_exibido(row)))
+
+    if isinstance(estado, tuple):
+        conflito = evento_atual(estado[1])
+        conflito_dialog(conflito['Nome do Evento'], conflito['Horario'])
+    elif estado in msgs_inscricao: st.error(msgs_inscricao[estado])
+
+# Página de administração escondida: ?admin=<ADMIN_TOKEN> (sem ADMIN_TOKEN configurado ela não existe)
+def metricas_prometheus():
+    idade, _ = idade_dados()
+    return get_metricas().prometheus(extras=contadores_api(), medidores={"idade_dados_segundos": round(idade, 1),
+                                                                         "snapshots_antigos_vivos": snapshots_antigos_vivos(),
+                                                                         "diario_pendentes": diario_pendentes()})
+
+def pagina_metricas():
+    st.title("📈 Métricas do servidor")
+    spans, contadores = get_metricas().resumo()
+    st.subheader("Tempos")
+    st.dataframe(pd.DataFrame(spans), hide_index=True, width="stretch")
+    st.subheader("Contadores")
+    st.dataframe(pd.DataFrame([{"contador": k, "valor": v} for k, v in {**contadores, **contadores_api()}.items()]), hide_index=True, width="stretch")
+    texto = metricas_prometheus()
+    st.download_button("Baixar (formato Prometheus)", texto, file_name="metricas.prom", mime="text/plain")
+    with st.expander("Texto Prometheus"): st.code(texto, language="text")
+
+ARQUIVO_METRICAS_INTERVALO = 15 # segundos entre gravações do METRICAS_ARQUIVO
+
+@st.cache_resource
+def get_exportador_metricas():
+    # Com METRICAS_ARQUIVO configurado, grava o texto Prometheus nele (textfile collector do node_exporter)
+    arquivo = config("METRICAS_ARQUIVO")
+    if not arquivo: return None
+    def gravar():
+        while True:
+            try:
+                with open(arquivo + ".tmp", "w", encoding="utf-8") as f: f.write(metricas_prometheus())
+                os.replace(arquivo + ".tmp", arquivo)
+            except OSError:
+                pass
+            time.sleep(ARQUIVO_METRICAS_INTERVALO)
+    t = threading.Thread(target=gravar, daemon=True, name="exportador-metricas"); t.start()
+    return t
+
+# Conferência leve do feed; sem mudança nos cards da tela não reroda nada
+@st.fragment(run_every=INTERVALO_VAGAS)
+def acompanhar_vagas():
+    # Inscrições desta sessão que saíram do diário: a recusa vira o aviso do card (mesmo caminho do ins_<idx>)
+    meus = st.session_state.get("diario", {})
+    terminadas = {idx: e for idx, e in ((idx, entrada_diario(id_)) for idx, id_ in meus.items()) if e is None or e["estado"] != PENDENTE}
+    for idx, e in terminadas.items():
+        del meus[idx]
+        if e and e["resultado"] != "ok": st.session_state[f"ins_{idx}"] = e["resultado"]
+    if terminadas: st.rerun()
+
+    seq, mudados = mudancas_desde(st.session_state.get("feed_seq", 0))
+    if seq == st.session_state.get("feed_seq", 0): return
+    # Confirmação aberta: não fecha a caixa do voluntário; o seq fica parado e a conferência volta depois
+    if st.session_state.get("confirmando"): return
+    st.session_state.feed_seq = seq
+    vistos = st.session_state.get("vistos", {})
+    alvo = vistos.keys() if mudados is None else mudados & vistos.keys()
+    if any(vagas_evento(idx) != vistos[idx] for idx in alvo):
+        get_metricas().contar("feed_atualizacao")
+        st.rerun()
+
+def _carregar_mais():
+    st.session_state.n_cards += TAM_PAGINA
+
+# Filtros + listagem num fragmento: mexer num filtro reroda só esta parte
+@st.fragment
+def painel_eventos(user):
+    # O seq do feed é lido antes do snapshot: o que mudar durante a renderização aparece na próxima conferência
+    st.session_state.feed_seq = get_feed()["seq"]
+    st.session_state.vistos, st.session_state.confirmando = {}, set()
+    motor = motor_filtros()
+    meus_deps = list(user['Deps'])
+
+    filtro_status = st.pills("Status:", STATUS_FILTRO, default="Vagas Abertas")
+    f_depto_pill = st.pills("Departamento:", ["Todos"] + meus_deps, default="Todos")
+
+    c1, c2 = st.columns(2)
+    with c1: f_nivel = st.selectbox("Filtrar por Nível:", ["Todos"] + list(cores_niveis.keys()))
+    with c2: f_data = st.date_input("A partir de:", value=date.today())
+
+    # Filtros: máscaras pré-calculadas e resultado memorizado por snapshot (voluntários com o mesmo perfil reaproveitam)
+    nome_u_comp = user['Nome'].lower().strip()
+    inscritos = minhas_inscricoes(nome_u_comp) | inscricoes_pendentes(nome_u_comp) if filtro_status == "Minhas Inscrições" else ()
+    with get_metricas().medir("filtro"):
+        df_f, memo = motor.filtrar(meus_deps, user['Nivel'], f_data, f_depto_pill, f_nivel, filtro_status, inscritos)
+    get_metricas().contar("filtro_memo_acerto" if memo else "filtro_memo_falta")
+
+    # Data anterior à janela: os eventos arquivados vêm do espelho, antes dos do snapshot e só para consulta
+    df_arq = eventos_arquivo(f_data)
+    if df_arq is not None:
+        insc_arq = df_arq.index[(df_arq['V1_N'] == nome_u_comp) | (df_arq['V2_N'] == nome_u_comp)] if filtro_status == "Minhas Inscrições" else ()
+        df_arq = filtrar_eventos(df_arq, meus_deps, user['Nivel'], f_data, f_depto_pill, f_nivel, filtro_status, insc_arq)
+    elif f_data < (inicio_janela() or f_data):
+        st.caption("🗄️ Eventos antigos indisponíveis no momento.")
+    n_arq = 0 if df_arq is None else len(df_arq)
+
+    # Listagem paginada: só a página visível vai para o navegador
+    chave_filtro = (filtro_status, f_depto_pill, f_nivel, f_data)
+    if st.session_state.get('filtro_ant') != chave_filtro:
+        st.session_state.filtro_ant = chave_filtro; st.session_state.n_cards = TAM_PAGINA
+
+    with get_metricas().medir("render_cards"):
+        for idx in (df_arq.index[:st.session_state.n_cards] if n_arq else []):
+            st.markdown(df_arq.at[idx, 'Card_HTML'], unsafe_allow_html=True)
+            st.caption("🗄️ Evento arquivado")
+        for idx in df_f.index[:max(st.session_state.n_cards - n_arq, 0)]: card_evento(idx, nome_u_comp)
+
+    if n_arq + len(df_f) > st.session_state.n_cards:
+        st.caption(f"Mostrando {st.session_state.n_cards} de {n_arq + len(df_f)} atividades")
+        st.button("Carregar mais", width="stretch", on_click=_carregar_mais)
 
 # --- 4. STYLE ---
 st.set_page_config(page_title="ProVida Escala", layout="centered")
@@ -122,6 +1198,10 @@ st.markdown("""
 if 'user' not in st.session_state: st.session_state.user = None
 if 'modo_edicao' not in st.session_state: st.session_state.modo_edicao = False
 
+get_exportador_metricas()
+if config("ADMIN_TOKEN") and st.query_params.get("admin") == str(config("ADMIN_TOKEN")):
+    pagina_metricas(); st.stop()
+
 # Carregamento inicial com Retry
 df_ev, df_us = load_data_cached()
 deps_na_planilha = sorted([d for d in df_ev['Departamento'].unique() if str(d).strip() != ""])
@@ -134,17 +1214,17 @@ if st.session_state.user is None:
         with st.form("busca_edicao"):
             email_b = st.text_input("E-mail cadastrado:").strip().lower()
             if st.form_submit_button("Buscar Cadastro", type="primary", width="stretch"):
-                user_row = df_us[df_us['Email'].astype(str).str.lower() == email_b]
-                if not user_row.empty: 
-                    st.session_state['edit_row'] = user_row.iloc[0].to_dict()
-                    st.session_state['edit_idx'] = user_row.index[0] + 2
+                achado = usuario_atual(email_b)
+                if achado:
+                    st.session_state['edit_row'] = achado[1]
+                    st.session_state['edit_idx'] = None if achado[0] is None else achado[0] + 2 # cadastro ainda no diário
                 else: st.error("E-mail não encontrado.")
         if 'edit_row' in st.session_state:
             with st.form("edicao_final"):
                 dados = st.session_state['edit_row']
                 n_e = st.text_input("Nome Crachá:", value=dados['Nome'])
                 t_e = st.text_input("Telefone:", value=dados['Telefone'])
-                d_e = st.multiselect("Seus Departamentos:", options=deps_na_planilha, default=[d.strip() for d in str(dados['Departamentos']).split(",") if d.strip() in deps_na_planilha])
+                d_e = st.multiselect("Seus Departamentos:", options=deps_na_planilha, default=[d for d in dados['Deps'] if d in deps_na_planilha])
                 niv_l = list(cores_niveis.keys())
                 niv_e = st.selectbox("Nível:", niv_l, index=niv_l.index(dados['Nivel']) if dados['Nivel'] in niv_l else 0)
                 if st.form_submit_button("Revisar Alterações", type="primary", width="stretch"):
@@ -154,8 +1234,8 @@ if st.session_state.user is None:
         with st.form("login"):
             em = st.text_input("E-mail para entrar:").strip().lower()
             if st.form_submit_button("Entrar no Sistema", type="primary", width="stretch"):
-                u = df_us[df_us['Email'].astype(str).str.lower() == em]
-                if not u.empty: st.session_state.user = u.iloc[0].to_dict(); st.rerun()
+                achado = usuario_atual(em)
+                if achado: st.session_state.user = achado[1]; st.rerun()
                 else: st.session_state['novo_em'] = em
         if 'novo_em' in st.session_state:
             with st.form("cad"):
@@ -163,73 +1243,32 @@ if st.session_state.user is None:
                 dc = st.multiselect("Departamentos:", options=deps_na_planilha)
                 nv = st.selectbox("Nível:", list(cores_niveis.keys()))
                 if st.form_submit_button("Cadastrar"):
-                    _, sheet_us = get_sheets()
-                    sheet_us.append_row([st.session_state['novo_em'], nc, tc, ",".join(dc), nv])
-                    st.session_state.user = {"Email": st.session_state['novo_em'], "Nome": nc, "Telefone": tc, "Departamentos": ",".join(dc), "Nivel": nv}
-                    st.cache_data.clear(); st.rerun()
+                    dados = [st.session_state['novo_em'], nc, tc, ",".join(dc), nv]
+                    salvo = registrar_no_diario("cadastro", f"cadastro:{email_norm(dados[0])}", dados) is not None
+                    if not salvo: # diário indisponível: grava direto
+                        try:
+                            adicionar_usuario_cache(enfileirar_escrita("Usuarios", dados).result(), dados); salvo = True
+                        except (gspread.exceptions.APIError, gspread.exceptions.WorksheetNotFound):
+                            st.error("Não foi possível salvar agora. Tente de novo em alguns segundos.")
+                    if salvo:
+                        st.session_state.user = registro_usuario({"Email": st.session_state['novo_em'], "Nome": nc, "Telefone": tc, "Departamentos": ",".join(dc), "Nivel": nv})
+                        st.rerun()
         st.divider()
         if st.button("⚙️ Alterar Meus Dados"): st.session_state.modo_edicao = True; st.rerun()
     st.stop()
 
 # --- 6. DASHBOARD ---
 user = st.session_state.user
-meus_deps = [d.strip() for d in str(user['Departamentos']).split(",") if d.strip() != ""]
 st.title(f"🤝 Olá, {user['Nome'].split()[0]}!")
-
-filtro_status = st.pills("Status:", ["Vagas Abertas", "Vagas Vazias", "Minhas Inscrições", "Tudo"], default="Vagas Abertas")
-f_depto_pill = st.pills("Departamento:", ["Todos"] + meus_deps, default="Todos")
-
-c1, c2 = st.columns(2)
-with c1: f_nivel = st.selectbox("Filtrar por Nível:", ["Todos"] + list(cores_niveis.keys()))
-with c2: f_data = st.date_input("A partir de:", value=date.today())
-
-# Processamento de Dados
-df_ev['Data_Dt'] = pd.to_datetime(df_ev['Data Específica'], errors='coerce', dayfirst=True)
-df_ev['Niv_N'] = df_ev['Nível'].astype(str).str.strip().map(mapa_niveis_num).fillna(99)
-df_ev = df_ev.sort_values(by=['Data_Dt', 'Horario']).reset_index(drop=False)
-
-df_f = df_ev[df_ev['Departamento'].isin(meus_deps)].copy()
-df_f = df_f[(df_f['Niv_N'] <= mapa_niveis_num.get(user['Nivel'], 0)) & (df_f['Data_Dt'].dt.date >= f_data)]
-
-if f_depto_pill != "Todos": df_f = df_f[df_f['Departamento'] == f_depto_pill]
-if f_nivel != "Todos": df_f = df_f[df_f['Nível'].astype(str).str.strip() == f_nivel]
-
-nome_u_comp = user['Nome'].lower().strip()
-if filtro_status == "Minhas Inscrições":
-    df_f = df_f[(df_f['Voluntário 1'].astype(str).str.lower().str.strip() == nome_u_comp) | (df_f['Voluntário 2'].astype(str).str.lower().str.strip() == nome_u_comp)]
-elif filtro_status == "Vagas Abertas":
-    df_f = df_f[(df_f['Voluntário 1'].astype(str).str.strip() == "") | (df_f['Voluntário 2'].astype(str).str.strip() == "")]
-elif filtro_status == "Vagas Vazias":
-    df_f = df_f[(df_f['Voluntário 1'].astype(str).str.strip() == "") & (df_f['Voluntário 2'].astype(str).str.strip() == "")]
-
-# Listagem
-for i, row in df_f.iterrows():
-    v1, v2 = str(row['Voluntário 1']).strip(), str(row['Voluntário 2']).strip()
-    dia_abreviado = dias_semana.get(row['Data_Dt'].strftime('%A'), "")
-    bg = cores_niveis.get(str(row['Nível']).strip(), "#FFFFFF")
-    tx = "#FFFFFF" if "AV2" in str(row['Nível']) else "#000000"
-    st_vaga = "🟢 Cheio" if v1 and v2 else ("🟡 1 Vaga" if v1 or v2 else "🔴 2 Vagas")
-
-    st.markdown(f"""
-        <div class="card-container" style="background-color: {bg}; color: {tx};">
-            <div class="card-header"><span style="opacity: 0.8;">{st_vaga}</span><span class="data-text">{dia_abreviado} - {row['Data_Dt'].strftime('%d/%m')}</span></div>
-            <h2 class="card-title" style="color: {tx};">{row['Nível']} - {row['Nome do Evento']}</h2>
-            <div style="font-weight: 800; margin-bottom: 10px;">🏢 {row['Departamento']} | ⏰ {row['Horario']}</div>
-            <div class="voluntarios-box"><b>Voluntário 1:</b> {v1 if v1 else "---"}<br><b>Voluntário 2:</b> {v2 if v2 else "---"}</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-    ja_in = (v1.lower() == nome_u_comp or v2.lower() == nome_u_comp)
-    if ja_in: st.button("✅ INSCRITO", key=f"bi_{i}", disabled=True, width="stretch")
-    elif v1 and v2: st.button("🚫 CHEIO", key=f"bf_{i}", disabled=True, width="stretch")
-    else:
-        if st.button("Quero me inscrever", key=f"bq_{i}", type="primary", width="stretch"):
-            conflito = df_ev[(df_ev['Data Específica'] == row['Data Específica']) & (df_ev['Horario'] == row['Horario']) & ((df_ev['Voluntário 1'].astype(str).str.lower().str.strip() == nome_u_comp) | (df_ev['Voluntário 2'].astype(str).str.lower().str.strip() == nome_u_comp))]
-            if not conflito.empty: conflito_dialog(conflito.iloc[0]['Nome do Evento'], conflito.iloc[0]['Horario'])
-            else:
-                v_alvo, c_alvo = ("Voluntário 1", 8) if v1 == "" else ("Voluntário 2", 9)
-                confirmar_dialog(int(row['index'])+2, row, c_alvo)
+painel_eventos(user)
+acompanhar_vagas()
 
 st.divider()
-if st.button("🔄 Sincronizar Planilha"): st.cache_data.clear(); st.rerun()
+idade, falhou = idade_dados()
+st.caption(f"🕒 Dados de {int(idade // 60)} min atrás" + (" · planilha indisponível, mostrando a última cópia" if falhou else ""))
+if st.button("🔄 Sincronizar Planilha"):
+    get_metricas().contar("sincronizacao_manual")
+    with st.spinner("Sincronizando..."): sincronizado = sincronizar()
+    if sincronizado: st.rerun()
+    st.error("O Google Sheets está ocupado. Aguarde 30 segundos e tente de novo.")
 if st.button("Sair"): st.session_state.user = None; st.rerun()
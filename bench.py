@@ -0,0 +1,138 @@
+"""Benchmark das etapas de dados do app com calendários sintéticos.
+
+Mede separadamente: planilha -> DataFrame, cada etapa das colunas derivadas (datas, níveis,
+voluntários, cards, ordenação), os filtros do painel para cada status, o índice de agenda e
+a checagem de conflito, e o índice de usuários. O resultado vai para um JSON para comparar
+entre versões.
+
+    python bench.py                                  # 1k/10k/100k eventos, 1k/10k/50k usuários
+    python bench.py --eventos 1000 --usuarios 1000 --repeticoes 5 --saida bench_resultados.json
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+import warnings
+from datetime import date, timedelta
+
+import pandas as pd
+
+import eventos as ev
+
+NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Elisa", "Fábio", "Gabriela", "Hugo", "Isabel", "João", "Karina", "Lucas",
+         "Marina", "Nelson", "Olívia", "Paulo", "Renata", "Sérgio", "Tânia", "Vítor"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Almeida", "Ferreira", "Rocha"]
+HORARIOS = ["07:00", "08:00", "09:30", "10:00", "14:00", "15:30", "19:00", "20:00"]
+CAB_EVENTOS = ["Nome do Evento", "Data Específica", "Horario", "Departamento", "Nível", "Observação", "Local", "Voluntário 1", "Voluntário 2"]
+CAB_USUARIOS = ["Email", "Nome", "Telefone", "Departamentos", "Nivel"]
+
+def gerar_nomes(rnd, n):
+    return [f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {i}" for i in range(n)]
+
+def gerar_eventos(rnd, n, voluntarios, n_deps=40, dias=365):
+    # Valores como a API devolve: texto, com células vazias no fim cortadas. ~2% das datas fora do dd/mm/aaaa.
+    deps, niveis, hoje = [f"Departamento {i:02d}" for i in range(n_deps)], list(ev.cores_niveis) + ["XX"], date.today()
+    linhas = [list(CAB_EVENTOS)]
+    for i in range(n):
+        d = hoje + timedelta(days=rnd.randint(-dias, dias))
+        data = d.isoformat() if rnd.random() < 0.02 else d.strftime("%d/%m/%Y")
+        v1 = rnd.choice(voluntarios) if rnd.random() < 0.5 else ""
+        v2 = rnd.choice(voluntarios) if v1 and rnd.random() < 0.4 else ""
+        linha = [f"Evento {i}", data, rnd.choice(HORARIOS), rnd.choice(deps), rnd.choice(niveis), "", "", v1, v2]
+        while linha and linha[-1] == "": linha.pop()
+        linhas.append(linha)
+    return linhas
+
+def gerar_usuarios(rnd, nomes, n_deps=40):
+    linhas = [list(CAB_USUARIOS)]
+    for i, nome in enumerate(nomes):
+        deps = ",".join(f"Departamento {d:02d}" for d in rnd.sample(range(n_deps), rnd.randint(1, 5)))
+        linhas.append([f"voluntario{i}@exemplo.org", nome, f"119{i:08d}", deps, rnd.choice(list(ev.cores_niveis))])
+    return linhas
+
+def medir(funcao, preparar, repeticoes):
+    # preparar() roda fora do tempo medido (cópia dos dados de entrada)
+    tempos = []
+    for _ in range(repeticoes):
+        arg = preparar()
+        t0 = time.perf_counter(); funcao(arg); tempos.append((time.perf_counter() - t0) * 1000)
+    return {"min_ms": round(min(tempos), 3), "mediana_ms": round(statistics.median(tempos), 3)}
+
+def bench_eventos(rnd, n, voluntarios, repeticoes):
+    res = {}
+    valores = gerar_eventos(rnd, n, voluntarios)
+    res["parse_eventos"] = medir(ev.montar_df, lambda: valores, repeticoes)
+
+    # Etapas das colunas derivadas, cada uma sobre a saída das anteriores
+    df = ev.montar_df(valores)
+    for nome, etapa in ev.ETAPAS_PREPARO:
+        res[f"preparo.{nome}"] = medir(etapa, df.copy, repeticoes)
+        df = etapa(df)
+    res["preparo_total"] = medir(ev.preparar_eventos, lambda: ev.montar_df(valores), repeticoes)
+    # Só a janela (60 dias atrás em diante) passa pelas etapas caras; o resto vai para o arquivo
+    res["preparo_janela_60d"] = medir(lambda d: ev.preparar_janela(d, date.today() - timedelta(days=60)), lambda: ev.montar_df(valores), repeticoes)
+    res["memoria_snapshot"] = {"mb": round(df.memory_usage(deep=True).sum() / 1e6, 2)}
+    res["card_unico"] = medir(lambda r: ev.montar_card(r), lambda: df.loc[df.index[rnd.randrange(len(df))]], repeticoes)
+
+    res["indexar_agenda"] = medir(ev.indexar_agenda, lambda: df, repeticoes)
+    agenda = ev.indexar_agenda(df)
+    amostra = [(v.lower(), df.at[i, 'Data Específica'], df.at[i, 'Horario']) for v, i in zip(rnd.choices(voluntarios, k=1000), rnd.choices(df.index, k=1000))]
+    res["conflito_x1000"] = medir(lambda a: [ev.conflito(agenda, *c) for c in a], lambda: amostra, repeticoes)
+
+    # Filtros do painel para um voluntário típico (5 departamentos, nível mais alto)
+    deps = [f"Departamento {d:02d}" for d in range(5)]
+    nome = voluntarios[0].lower()
+    inscritos = ev.inscricoes(agenda, nome)
+    for status in ev.STATUS_FILTRO:
+        res[f"filtro.{status}"] = medir(lambda s: ev.filtrar_eventos(df, deps, "AV4A", date.today(), status=s, inscritos=inscritos), lambda: status, repeticoes)
+    res["filtro.depto_nivel"] = medir(lambda s: ev.filtrar_eventos(df, deps, "AV4A", date.today(), deps[0], "BAS", s), lambda: "Vagas Abertas", repeticoes)
+    # Motor de filtros: primeira consulta num snapshot novo (máscaras frias) e a mesma consulta já memorizada
+    res["filtro_motor.frio"] = medir(lambda m: m.filtrar(deps, "AV4A", date.today(), status="Vagas Abertas"), lambda: ev.MotorFiltros(df, 0), repeticoes)
+    motor = ev.MotorFiltros(df, 0); motor.filtrar(deps, "AV4A", date.today(), status="Vagas Abertas")
+    res["filtro_motor.memo"] = medir(lambda m: m.filtrar(deps, "AV4A", date.today(), status="Vagas Abertas"), lambda: motor, repeticoes)
+    return res
+
+def bench_usuarios(rnd, nomes, repeticoes):
+    valores = gerar_usuarios(rnd, nomes)
+    res = {"parse_usuarios": medir(lambda v: ev.montar_df(v, CAB_USUARIOS), lambda: valores, repeticoes)}
+    res["preparo_usuarios"] = medir(ev.preparar_usuarios, lambda: ev.montar_df(valores), repeticoes)
+    df = ev.preparar_usuarios(ev.montar_df(valores))
+    res["indexar_usuarios"] = medir(ev.indexar_usuarios, lambda: df, repeticoes)
+    res["memoria_usuarios"] = {"mb": round(df.memory_usage(deep=True).sum() / 1e6, 2)}
+    return res
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--eventos", default="1000,10000,100000", help="tamanhos do calendário, separados por vírgula")
+    ap.add_argument("--usuarios", default="1000,10000,50000", help="tamanhos da aba Usuarios, separados por vírgula")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--saida", default="bench_resultados.json")
+    args = ap.parse_args()
+    warnings.simplefilter("ignore", UserWarning) # aviso do dayfirst nas datas fora do padrão (esperado)
+
+    rnd = random.Random(args.semente)
+    tam_ev = [int(x) for x in args.eventos.split(",") if x]
+    tam_us = [int(x) for x in args.usuarios.split(",") if x]
+    nomes = gerar_nomes(rnd, max(tam_us + [1000]))
+    resultados = []
+    for n in tam_ev:
+        for etapa, t in bench_eventos(rnd, n, nomes[:max(50, n // 20)], args.repeticoes).items():
+            resultados.append({"etapa": etapa, "eventos": n, **t})
+    for n in tam_us:
+        for etapa, t in bench_usuarios(rnd, nomes[:n], args.repeticoes).items():
+            resultados.append({"etapa": etapa, "usuarios": n, **t})
+
+    meta = {"data": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "pandas": pd.__version__,
+            "maquina": platform.platform(), "repeticoes": args.repeticoes, "semente": args.semente}
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "resultados": resultados}, f, ensure_ascii=False, indent=1)
+    for r in resultados:
+        valor = f"{r['mb']:>10.2f} MB" if "mb" in r else f"{r['min_ms']:>10.2f} ms  (mediana {r['mediana_ms']:.2f})"
+        print(f"{r['etapa']:<28} {r.get('eventos', r.get('usuarios')):>8}  {valor}")
+    print(f"-> {args.saida}")
+
+if __name__ == "__main__":
+    main()
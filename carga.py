@@ -0,0 +1,154 @@
+"""Teste de carga do app.py: várias sessões simuladas (streamlit.testing) contra a planilha local.
+
+Cada sessão entra com um e-mail, filtra por departamento, clica em "Quero me inscrever" num card
+com vaga e em "Confirmar Inscrição", e confere o card em "Minhas Inscrições" (esperando a inscrição
+sair do diário de escritas do app, como o voluntário veria). Poucos eventos para
+muitas sessões forçam a disputa pelas vagas. Relata p50/p95 do tempo de cada rerun, chamadas à
+planilha por ação e por inscrição, e atualizações perdidas (sessão viu a inscrição confirmada, mas
+o nome não está na planilha no fim).
+
+O AppTest troca o Runtime global do Streamlit a cada execução e não pode rodar em várias threads.
+As sessões abertas ao mesmo tempo (--paralelas) se intercalam passo a passo numa thread só, no mesmo
+processo (mesmo cache, fila de escrita e atualizador do servidor); as threads do app continuam em
+segundo plano. Cada rerun é medido sozinho, sem disputa de CPU com os outros.
+
+    python carga.py --sessoes 40 --paralelas 10 --eventos 15 --latencia 0.05
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import planilha_local
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DEPARTAMENTOS = ["Recepção", "Som", "Cozinha"]
+
+def gerar_planilha(n_sessoes, n_eventos):
+    eventos = [list(planilha_local.ABAS_PADRAO["Calendario_Eventos"][0])]
+    for i in range(n_eventos):
+        d = date.today() + timedelta(days=1 + i // 3)
+        eventos.append([f"Evento {i}", d.strftime("%d/%m/%Y"), ["08:00", "10:00", "14:00"][i % 3], DEPARTAMENTOS[i % len(DEPARTAMENTOS)], "BAS"])
+    usuarios = [list(planilha_local.ABAS_PADRAO["Usuarios"][0])]
+    for i in range(n_sessoes):
+        usuarios.append([f"carga{i}@teste.org", f"Carga {i}", "", ",".join(DEPARTAMENTOS), "AV4A"])
+    return {"Calendario_Eventos": eventos, "Usuarios": usuarios}
+
+def percentil(valores, p):
+    if not valores: return None
+    v = sorted(valores)
+    return round(v[min(len(v) - 1, int(round(p / 100 * (len(v) - 1))))] * 1000, 1)
+
+class Sessao:
+    def __init__(self, i, rnd, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.i, self.rnd, self.nome = i, rnd, f"Carga {i}"
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.tempos, self.chamadas, self.resultado, self.evento = {}, {}, None, None
+
+    def _acao(self, nome, preparar=None):
+        # Um rerun medido: tempo e chamadas à planilha (as das threads do app no meio também entram)
+        antes = sum(planilha_local.CONTADORES.values())
+        t0 = time.perf_counter()
+        if preparar: preparar()
+        self.at.run()
+        self.tempos[nome] = time.perf_counter() - t0
+        self.chamadas[nome] = sum(planilha_local.CONTADORES.values()) - antes
+        if self.at.exception: raise RuntimeError(f"sessão {self.i}, {nome}: {self.at.exception[0].value}")
+
+    def _botao(self, rotulo):
+        return [b for b in self.at.button if b.label == rotulo]
+
+    def passos(self):
+        # Gerador: um rerun por passo, para o driver intercalar as sessões
+        self._acao("abrir"); yield
+        self._acao("login", lambda: ([t for t in self.at.text_input if t.label == "E-mail para entrar:"][0].set_value(f"carga{self.i}@teste.org"),
+                                     [b for b in self.at.button if b.label.startswith("Entrar")][0].click())); yield
+        self._acao("filtro", lambda: self.at.pills[1].set_value(self.rnd.choice(DEPARTAMENTOS))); yield
+        abertos = self._botao("Quero me inscrever")
+        if not abertos: self.resultado = "sem_vaga"; return
+        alvo = self.rnd.choice(abertos)
+        self.evento = int(alvo.key.split("_")[1])
+        self._acao("quero", alvo.click); yield
+        confirmar = [b for b in self.at.button if b.key == f"bc_{self.evento}"]
+        if not confirmar: self.resultado = "sem_confirmacao"; return
+        self._acao("confirmar", confirmar[0].click); yield
+        erro = next((e.value for e in self.at.error), None)
+        if erro: self.resultado = erro; return
+        # Card cheio some de "Vagas Abertas": confere em "Minhas Inscrições", como o voluntário faria.
+        # Enquanto a inscrição estiver no diário o card diz "sendo salva"; as outras sessões seguem no meio.
+        self._acao("conferir", lambda: self.at.pills[0].set_value("Minhas Inscrições"))
+        for _ in range(200):
+            if not any(b.key == f"bp_{self.evento}" for b in self.at.button): break
+            yield
+            time.sleep(0.02); self.at.run()
+        erro = next((e.value for e in self.at.error), None)
+        self.resultado = "ok" if any(b.key == f"bi_{self.evento}" for b in self.at.button) else (erro or "nao_confirmada")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sessoes", type=int, default=20)
+    ap.add_argument("--paralelas", type=int, default=5, help="sessões abertas ao mesmo tempo (intercaladas)")
+    ap.add_argument("--eventos", type=int, default=10)
+    ap.add_argument("--latencia", type=float, default=0.02, help="segundos por chamada à planilha local")
+    ap.add_argument("--erro-cota", type=float, default=0.0, help="chance de 429 por chamada")
+    ap.add_argument("--semente", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--saida", help="grava o relatório em JSON")
+    args = ap.parse_args()
+    saida = os.path.abspath(args.saida) if args.saida else None
+
+    pasta = tempfile.mkdtemp(prefix="carga_")
+    arquivo = os.path.join(pasta, "planilha.json")
+    with open(arquivo, "w", encoding="utf-8") as f: json.dump(gerar_planilha(args.sessoes, args.eventos), f, ensure_ascii=False)
+    os.chdir(pasta) # espelho SQLite do app fica na pasta temporária
+    os.environ.update(PLANILHA_BACKEND="local", PLANILHA_ARQUIVO=arquivo, PLANILHA_LATENCIA=str(args.latencia), PLANILHA_ERRO_COTA=str(args.erro_cota))
+
+    rnd = random.Random(args.semente)
+    fila, ativas, sessoes, falhas = list(range(args.sessoes)), [], [], []
+    t0 = time.perf_counter()
+    while fila or ativas:
+        while fila and len(ativas) < args.paralelas:
+            s = Sessao(fila.pop(0), random.Random(rnd.random()), args.timeout)
+            ativas.append((s, s.passos()))
+        s, passos = ativas[rnd.randrange(len(ativas))]
+        try:
+            next(passos)
+        except StopIteration:
+            ativas.remove((s, passos)); sessoes.append(s)
+        except Exception as e:
+            ativas.remove((s, passos)); falhas.append(f"sessão {s.i}: {e}")
+    duracao = time.perf_counter() - t0
+    diario = os.path.join(pasta, "diario_escritas.sqlite3")
+    for _ in range(100): # entradas que ainda estejam no diário do app
+        if not os.path.exists(diario) or not sqlite3.connect(diario).execute("SELECT COUNT(*) FROM diario WHERE estado = 'pendente'").fetchone()[0]: break
+        time.sleep(0.2)
+    time.sleep(1) # fila de escrita do app
+
+    final = planilha_local.Planilha(arquivo=arquivo).dados["Calendario_Eventos"]
+    inscritos = {(i - 2, str(v).strip()) for i, linha in enumerate(final[1:], start=2) for v in linha[7:9] if str(v).strip()}
+    confirmados = [s for s in sessoes if s.resultado == "ok"]
+    perdidas = [s.i for s in confirmados if (s.evento, s.nome) not in inscritos]
+    acoes = ["abrir", "login", "filtro", "quero", "confirmar", "conferir"]
+    relatorio = {
+        "config": vars(args), "duracao_s": round(duracao, 2), "sessoes_ok": len(sessoes), "falhas": falhas,
+        "rerun_ms": {a: {"p50": percentil([s.tempos[a] for s in sessoes if a in s.tempos], 50),
+                         "p95": percentil([s.tempos[a] for s in sessoes if a in s.tempos], 95)} for a in acoes},
+        "chamadas_por_acao": {a: round(statistics.mean([s.chamadas[a] for s in sessoes if a in s.chamadas] or [0]), 2) for a in acoes},
+        "chamadas_total": dict(planilha_local.CONTADORES),
+        "chamadas_por_inscricao": round(sum(planilha_local.CONTADORES.values()) / max(len(confirmados), 1), 2),
+        "resultados": {r: sum(1 for s in sessoes if s.resultado == r) for r in {s.resultado for s in sessoes}},
+        "vagas_preenchidas": len(inscritos), "vagas_total": 2 * args.eventos,
+        "atualizacoes_perdidas": perdidas,
+    }
+    print(json.dumps(relatorio, ensure_ascii=False, indent=1))
+    if saida:
+        with open(saida, "w", encoding="utf-8") as f: json.dump(relatorio, f, ensure_ascii=False, indent=1)
+
+if __name__ == "__main__":
+    main()
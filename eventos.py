@@ -0,0 +1,220 @@
+"""Calendário e usuários sem Streamlit: DataFrames, colunas derivadas, cards, índices e filtros.
+
+Usado pelo app.py e pelo bench.py, que mede cada etapa com dados sintéticos.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+cores_niveis = {
+    "Nenhum": "#FFFFFF", "BAS": "#C8E6C9", "AV1": "#FFCDD2", "IN": "#BBDEFB",
+    "AV2": "#795548", "AV2-24": "#795548", "AV2-23": "#795548", "AV2/": "#795548",
+    "AV3": "#E1BEE7", "AV3A": "#E1BEE7", "AV3/": "#E1BEE7", "AV4": "#FFF9C4", "AV4A": "#FFF9C4"
+}
+mapa_niveis_num = {k: i for i, k in enumerate(cores_niveis.keys())}
+dias_semana = {"Monday": "Seg", "Tuesday": "Ter", "Wednesday": "Qua", "Thursday": "Qui", "Friday": "Sex", "Saturday": "Sáb", "Sunday": "Dom"}
+STATUS_FILTRO = ["Vagas Abertas", "Vagas Vazias", "Minhas Inscrições", "Tudo"]
+
+COLS_USUARIOS = ['Email', 'Nome', 'Telefone', 'Departamentos', 'Nivel']
+COLS_VOLUNTARIOS = {"Voluntário 1": "V1_N", "Voluntário 2": "V2_N"} # coluna -> nome normalizado (minúsculo, sem espaços)
+COLS_DERIVADAS = ['Data_Dt', 'Niv_S', 'Niv_N', 'V1_N', 'V2_N', 'Card_HTML']
+# Poucos valores distintos repetidos em milhares de linhas: categóricas (códigos inteiros + tabela de valores)
+COLS_CATEGORIAS_EV = ['Data Específica', 'Horario', 'Departamento', 'Nível', 'Niv_S', 'Voluntário 1', 'Voluntário 2', 'V1_N', 'V2_N']
+COLS_CATEGORIAS_US = ['Departamentos', 'Nivel']
+
+def montar_df(valores, colunas_padrao=()):
+    # Primeira linha é o cabeçalho; a API corta as células vazias do fim de cada linha
+    if not valores: return pd.DataFrame(columns=list(colunas_padrao))
+    cab = [str(c).strip() for c in valores[0]]
+    return pd.DataFrame([(r + [""] * len(cab))[:len(cab)] for r in valores[1:]], columns=cab)
+
+def colunas_planilha(df_ev):
+    return [c for c in df_ev.columns if c not in COLS_DERIVADAS]
+
+def montar_card(row):
+    # HTML do card; gerado na carga e refeito só quando os voluntários da linha mudam
+    v1, v2 = str(row['Voluntário 1']).strip(), str(row['Voluntário 2']).strip()
+    data_ok = not pd.isna(row['Data_Dt'])
+    dia_abreviado = dias_semana.get(row['Data_Dt'].strftime('%A'), "") if data_ok else ""
+    bg = cores_niveis.get(str(row['Nível']).strip(), "#FFFFFF")
+    tx = "#FFFFFF" if "AV2" in str(row['Nível']) else "#000000"
+    st_vaga = "🟢 Cheio" if v1 and v2 else ("🟡 1 Vaga" if v1 or v2 else "🔴 2 Vagas")
+    return f"""
+        <div class="card-container" style="background-color: {bg}; color: {tx};">
+            <div class="card-header"><span style="opacity: 0.8;">{st_vaga}</span><span class="data-text">{dia_abreviado} - {row['Data_Dt'].strftime('%d/%m') if data_ok else ""}</span></div>
+            <h2 class="card-title" style="color: {tx};">{row['Nível']} - {row['Nome do Evento']}</h2>
+            <div style="font-weight: 800; margin-bottom: 10px;">🏢 {row['Departamento']} | ⏰ {row['Horario']}</div>
+            <div class="voluntarios-box"><b>Voluntário 1:</b> {v1 if v1 else "---"}<br><b>Voluntário 2:</b> {v2 if v2 else "---"}</div>
+        </div>
+    """
+
+# --- Colunas derivadas ---
+# Calculadas uma vez por carga; os reruns só aplicam filtros.
+def converter_datas(df):
+    data_txt = df['Data Específica'].astype(str).str.strip()
+    df['Data_Dt'] = pd.to_datetime(data_txt, format="%d/%m/%Y", errors='coerce')
+    fora_do_padrao = df['Data_Dt'].isna() & (data_txt != "")
+    if fora_do_padrao.any():
+        df.loc[fora_do_padrao, 'Data_Dt'] = pd.to_datetime(data_txt[fora_do_padrao], errors='coerce', dayfirst=True)
+    return df
+
+def derivar_niveis(df):
+    df['Niv_S'] = df['Nível'].astype(str).str.strip()
+    df['Niv_N'] = df['Niv_S'].map(mapa_niveis_num).fillna(99).astype('int8')
+    return df
+
+def normalizar_voluntarios(df):
+    for coluna, norm in COLS_VOLUNTARIOS.items():
+        df[norm] = df[coluna].astype(str).str.lower().str.strip()
+    return df
+
+def gerar_cards(df):
+    df['Card_HTML'] = [montar_card(r) for r in df.to_dict('records')]
+    return df
+
+def compactar(df, colunas):
+    for c in colunas:
+        if c in df.columns: df[c] = df[c].astype(str).astype('category')
+    return df
+
+def compactar_eventos(df):
+    return compactar(df, COLS_CATEGORIAS_EV)
+
+def ordenar(df):
+    # O índice continua sendo a posição na planilha (linha = índice + 2) mesmo depois de ordenar
+    return df.sort_values(by=['Data_Dt', 'Horario'])
+
+ETAPAS_PREPARO = [("datas", converter_datas), ("niveis", derivar_niveis), ("voluntarios", normalizar_voluntarios),
+                  ("cards", gerar_cards), ("categorias", compactar_eventos), ("ordenar", ordenar)]
+
+def preparar_eventos(df):
+    for _, etapa in ETAPAS_PREPARO: df = etapa(df)
+    return df
+
+def preparar_janela(df, inicio):
+    # (quentes, arquivo): só as linhas a partir de `inicio` passam pelas etapas caras (cards, categorias...);
+    # as anteriores voltam só com Data_Dt. Sem data válida fica nas quentes, como sempre ficou.
+    df = converter_datas(df)
+    if inicio is None: antigo = np.zeros(len(df), dtype=bool)
+    else: antigo = (df['Data_Dt'] < pd.Timestamp(inicio)).to_numpy()
+    quentes = df[~antigo].copy()
+    for nome, etapa in ETAPAS_PREPARO:
+        if nome != "datas": quentes = etapa(quentes)
+    return quentes, df[antigo]
+
+# --- Índices ---
+def email_norm(email):
+    return str(email).lower().strip()
+
+def preparar_usuarios(df_us):
+    return compactar(df_us, COLS_CATEGORIAS_US)
+
+def deps_usuario(texto):
+    # "Som, Recepção" -> ("Som", "Recepção"), sem repetidos e na ordem do cadastro
+    return tuple(dict.fromkeys(d.strip() for d in str(texto).split(",") if d.strip()))
+
+def registro_usuario(reg):
+    # Registro do usuário com os departamentos já separados (o painel não refaz o split a cada rerun)
+    return {**reg, 'Deps': deps_usuario(reg['Departamentos'])}
+
+def indexar_usuarios(df_us):
+    # e-mail -> (índice no df_us, registro); em e-mail repetido vale a primeira linha, como antes
+    idx = {}
+    for i, reg in zip(df_us.index, df_us.to_dict('records')):
+        idx.setdefault(email_norm(reg['Email']), (i, registro_usuario(reg)))
+    return idx
+
+def slot(df_ev, idx):
+    return (df_ev.at[idx, 'Data Específica'], df_ev.at[idx, 'Horario'])
+
+def indexar_agenda(df_ev):
+    # nome normalizado -> {(data, horário): {índices das linhas}}
+    agenda = {}
+    for norm in COLS_VOLUNTARIOS.values():
+        for idx, nome, data, horario in zip(df_ev.index, df_ev[norm], df_ev['Data Específica'], df_ev['Horario']):
+            if nome: agenda.setdefault(nome, {}).setdefault((data, horario), set()).add(idx)
+    return agenda
+
+def conflito(agenda, nome_norm, data, horario):
+    # Índice de um evento do voluntário no mesmo dia/horário, ou None
+    linhas = agenda.get(nome_norm, {}).get((data, horario))
+    return next(iter(linhas)) if linhas else None
+
+def inscricoes(agenda, nome_norm):
+    return set().union(*agenda.get(nome_norm, {}).values())
+
+# --- Filtros do painel ---
+def filtrar_eventos(df_ev, deps, nivel_usuario, data_ini, depto="Todos", nivel="Todos", status="Tudo", inscritos=()):
+    # inscritos: índices do voluntário (só usado em "Minhas Inscrições")
+    df_f = df_ev[df_ev['Departamento'].isin(deps)]
+    df_f = df_f[(df_f['Niv_N'] <= mapa_niveis_num.get(nivel_usuario, 0)) & (df_f['Data_Dt'] >= pd.Timestamp(data_ini))]
+
+    if depto != "Todos": df_f = df_f[df_f['Departamento'] == depto]
+    if nivel != "Todos": df_f = df_f[df_f['Niv_S'] == nivel]
+
+    if status == "Minhas Inscrições":
+        df_f = df_f[df_f.index.isin(inscritos)]
+    elif status == "Vagas Abertas":
+        df_f = df_f[(df_f['V1_N'] == "") | (df_f['V2_N'] == "")]
+    elif status == "Vagas Vazias":
+        df_f = df_f[(df_f['V1_N'] == "") & (df_f['V2_N'] == "")]
+    return df_f
+
+TAM_LRU_FILTROS = 256 # Combinações de filtro guardadas por snapshot
+
+class MotorFiltros:
+    """Mesmos filtros de filtrar_eventos para um snapshot fixo, com máscaras e resultados memorizados.
+
+    Máscaras por departamento, nível, data e vaga saem das colunas categóricas (comparação de códigos) na
+    primeira vez que são pedidas e são combinadas com & e |. O resultado (posições das linhas) fica num LRU
+    com a versão do snapshot na chave; o motor inteiro é descartado quando entra um snapshot novo.
+    """
+    def __init__(self, df_ev, versao, tamanho=TAM_LRU_FILTROS):
+        self.df, self.versao, self.tamanho = df_ev, versao, tamanho
+        self.lock = threading.Lock()
+        self.resultados = OrderedDict()
+        self.mascaras = {}
+
+    def _memo(self, chave, calc):
+        m = self.mascaras.get(chave)
+        if m is None:
+            if len(self.mascaras) > self.tamanho: self.mascaras.clear()
+            m = self.mascaras[chave] = calc()
+        return m
+
+    def _igual(self, coluna, valor):
+        def calc():
+            s = self.df[coluna]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                cats = s.cat.categories
+                return s.cat.codes.to_numpy() == cats.get_loc(valor) if valor in cats else np.zeros(len(s), dtype=bool)
+            return (s == valor).to_numpy()
+        return self._memo(("=", coluna, valor), calc)
+
+    def _mascara(self, deps, nivel_usuario, data_ini, depto, nivel, status, inscritos):
+        m = np.zeros(len(self.df), dtype=bool)
+        for d in deps: m |= self._igual('Departamento', d)
+        nv = mapa_niveis_num.get(nivel_usuario, 0)
+        m &= self._memo(("nivel<=", nv), lambda: self.df['Niv_N'].to_numpy() <= nv)
+        m &= self._memo(("data>=", data_ini), lambda: (self.df['Data_Dt'] >= pd.Timestamp(data_ini)).to_numpy())
+        if depto != "Todos": m &= self._igual('Departamento', depto)
+        if nivel != "Todos": m &= self._igual('Niv_S', nivel)
+        if status == "Minhas Inscrições": m &= self.df.index.isin(list(inscritos))
+        elif status == "Vagas Abertas": m &= self._igual('V1_N', "") | self._igual('V2_N', "")
+        elif status == "Vagas Vazias": m &= self._igual('V1_N', "") & self._igual('V2_N', "")
+        return m
+
+    def filtrar(self, deps, nivel_usuario, data_ini, depto="Todos", nivel="Todos", status="Tudo", inscritos=()):
+        # Devolve (df filtrado, se veio do LRU). "Minhas Inscrições" depende do voluntário: as inscrições entram na chave.
+        chave = (self.versao, tuple(deps), nivel_usuario, status, depto, nivel, data_ini,
+                 frozenset(inscritos) if status == "Minhas Inscrições" else None)
+        with self.lock:
+            pos = self.resultados.get(chave)
+            memo = pos is not None
+            if memo: self.resultados.move_to_end(chave)
+            else:
+                pos = self.resultados[chave] = np.flatnonzero(self._mascara(deps, nivel_usuario, data_ini, depto, nivel, status, inscritos))
+                if len(self.resultados) > self.tamanho: self.resultados.popitem(last=False)
+        return self.df.iloc[pos], memo
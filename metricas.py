@@ -0,0 +1,69 @@
+"""Métricas do servidor: tempos das etapas (spans) e contadores, com saída no formato texto do Prometheus.
+
+Um Registro por processo (o app guarda o seu em st.cache_resource). Os tempos vão para um histograma
+de baldes fixos, o que basta para p50/p95 aproximados e para o Prometheus calcular os quantis.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # segundos
+
+class Registro:
+    def __init__(self, prefixo="provida"):
+        self.prefixo = prefixo
+        self.lock = threading.Lock()
+        self.spans = {} # nome -> {"n", "soma", "max", "baldes": contagem por balde (não acumulada)}
+        self.contadores = {}
+        self.inicio = time.time()
+
+    def observar(self, nome, segundos):
+        with self.lock:
+            s = self.spans.setdefault(nome, {"n": 0, "soma": 0.0, "max": 0.0, "baldes": [0] * (len(BALDES) + 1)})
+            s["n"] += 1; s["soma"] += segundos; s["max"] = max(s["max"], segundos)
+            s["baldes"][next((i for i, b in enumerate(BALDES) if segundos <= b), len(BALDES))] += 1
+
+    @contextmanager
+    def medir(self, nome):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - t0)
+
+    def contar(self, nome, n=1):
+        with self.lock: self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def _quantil(self, s, q):
+        # Limite superior do balde onde cai o quantil (o último balde usa o máximo visto)
+        alvo, acc = q * s["n"], 0
+        for i, c in enumerate(s["baldes"]):
+            acc += c
+            if acc >= alvo and c: return BALDES[i] if i < len(BALDES) else s["max"]
+        return s["max"]
+
+    def resumo(self):
+        with self.lock:
+            spans = [{"span": nome, "chamadas": s["n"], "media_ms": round(s["soma"] / s["n"] * 1000, 1),
+                      "p50_ms": round(min(self._quantil(s, 0.5), s["max"]) * 1000, 1), "p95_ms": round(min(self._quantil(s, 0.95), s["max"]) * 1000, 1),
+                      "max_ms": round(s["max"] * 1000, 1), "total_s": round(s["soma"], 2)} for nome, s in sorted(self.spans.items())]
+            return spans, dict(sorted(self.contadores.items()))
+
+    def prometheus(self, extras=None, medidores=None):
+        # extras: outros contadores (ex.: os do limitador); medidores: valores instantâneos (gauges)
+        p, linhas = self.prefixo, []
+        with self.lock:
+            linhas += [f"# HELP {p}_span_seconds Tempo das etapas do app.", f"# TYPE {p}_span_seconds histogram"]
+            for nome, s in sorted(self.spans.items()):
+                acc = 0
+                for limite, c in zip(BALDES + ("+Inf",), s["baldes"]):
+                    acc += c
+                    linhas.append(f'{p}_span_seconds_bucket{{span="{nome}",le="{limite}"}} {acc}')
+                linhas.append(f'{p}_span_seconds_sum{{span="{nome}"}} {s["soma"]:.6f}')
+                linhas.append(f'{p}_span_seconds_count{{span="{nome}"}} {s["n"]}')
+            contadores = {**self.contadores, **(extras or {})}
+        linhas += [f"# HELP {p}_eventos_total Contadores do app.", f"# TYPE {p}_eventos_total counter"]
+        linhas += [f'{p}_eventos_total{{evento="{nome}"}} {v}' for nome, v in sorted(contadores.items())]
+        for nome, v in sorted({"inicio_segundos": self.inicio, **(medidores or {})}.items()):
+            linhas += [f"# TYPE {p}_{nome} gauge", f"{p}_{nome} {v}"]
+        return "\n".join(linhas) + "\n"
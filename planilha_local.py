@@ -0,0 +1,184 @@
+"""Planilha local com a mesma interface do gspread usada pelo app.
+
+Cliente -> open_by_key -> Planilha -> worksheet -> Aba, com as chamadas que o app.py faz:
+get_all_records, get_all_values, get, batch_get, cell, update_cell, update, append_row
+(na aba) e values_get, values_batch_get, values_batch_update, values_append (na planilha).
+
+Serve para rodar, testar carga e medir o app sem a planilha real e sem credenciais.
+Os dados ficam em memória e, se houver `arquivo`, são lidos e gravados num JSON
+({"Aba": [[cabeçalho], [linha], ...]}). Dá para simular latência e erros de cota (429).
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import requests
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range
+
+ABAS_PADRAO = {
+    "Calendario_Eventos": [["Nome do Evento", "Data Específica", "Horario", "Departamento", "Nível", "Observação", "Local", "Voluntário 1", "Voluntário 2"]],
+    "Usuarios": [["Email", "Nome", "Telefone", "Departamentos", "Nivel"]],
+}
+
+# Chamadas de todas as planilhas locais do processo (o teste de carga não enxerga o cliente criado pelo app)
+CONTADORES = Counter()
+
+def erro_api(status, mensagem):
+    # APIError igual ao do gspread (o app lê e.response.status_code)
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps({"error": {"code": status, "message": mensagem, "status": ""}}).encode()
+    return APIError(resp)
+
+def _limites(intervalo):
+    # "A2:A" -> (linha_ini, linha_fim, col_ini, col_fim), base 0, fim exclusivo (None = até o fim)
+    g = a1_range_to_grid_range(intervalo)
+    return g.get("startRowIndex", 0), g.get("endRowIndex"), g.get("startColumnIndex", 0), g.get("endColumnIndex")
+
+def _separar(intervalo):
+    # "'Aba'!A2:A" -> ("Aba", "A2:A"); só o nome da aba -> ("Aba", None)
+    aba, _, celulas = intervalo.rpartition("!") if "!" in intervalo else (intervalo, "", None)
+    return aba.strip("'"), celulas or None
+
+class Cell:
+    def __init__(self, row, col, value):
+        self.row, self.col, self.value = row, col, value
+
+class Aba:
+    def __init__(self, planilha, titulo):
+        self.planilha, self.title = planilha, titulo
+
+    @property
+    def _linhas(self):
+        return self.planilha.dados[self.title]
+
+    def _ler(self, celulas=None):
+        li, lf, ci, cf = _limites(celulas) if celulas else (0, None, 0, None)
+        saida = [[str(v) for v in linha[ci:cf]] for linha in self._linhas[li:lf]]
+        for linha in saida: # como a API: sem células vazias no fim da linha nem linhas vazias no fim
+            while linha and linha[-1] == "": linha.pop()
+        while saida and not saida[-1]: saida.pop()
+        return saida
+
+    def _gravar(self, linha, col, valores):
+        for i, vals in enumerate(valores):
+            while len(self._linhas) < linha + i: self._linhas.append([])
+            atual = self._linhas[linha + i - 1]
+            atual.extend([""] * (col - 1 + len(vals) - len(atual)))
+            atual[col - 1:col - 1 + len(vals)] = ["" if v is None else str(v) for v in vals]
+
+    def get_all_values(self):
+        return self.planilha._chamar(lambda: self._ler(), escrita=False)
+
+    def get_all_records(self):
+        def ler():
+            valores = self._ler()
+            if not valores: return []
+            cab = valores[0]
+            return [dict(zip(cab, v + [""] * (len(cab) - len(v)))) for v in valores[1:]]
+        return self.planilha._chamar(ler, escrita=False)
+
+    def get(self, intervalo=None):
+        return self.planilha._chamar(lambda: self._ler(intervalo), escrita=False)
+
+    def batch_get(self, intervalos):
+        return self.planilha._chamar(lambda: [self._ler(i) for i in intervalos], escrita=False)
+
+    def cell(self, row, col):
+        def ler():
+            linha = self._linhas[row - 1] if row <= len(self._linhas) else []
+            valor = str(linha[col - 1]) if col <= len(linha) else ""
+            return Cell(row, col, valor or None)
+        return self.planilha._chamar(ler, escrita=False)
+
+    def update_cell(self, row, col, value):
+        return self.planilha._chamar(lambda: self._gravar(row, col, [[value]]))
+
+    def update(self, values=None, range_name=None, **kwargs):
+        if isinstance(values, str): values, range_name = range_name, values # ordem antiga: update("A1", [[...]])
+        li, _, ci, _ = _limites(range_name or "A1")
+        return self.planilha._chamar(lambda: self._gravar(li + 1, ci + 1, values))
+
+    def append_row(self, values, **kwargs):
+        return self.planilha._chamar(lambda: self._linhas.append(["" if v is None else str(v) for v in values]))
+
+class Planilha:
+    def __init__(self, dados=None, arquivo=None, latencia=0.0, erro_cota=0.0, cota_por_minuto=None):
+        # latencia: segundos por chamada (número ou (mín, máx)); erro_cota: chance de 429 por chamada;
+        # cota_por_minuto: 429 de verdade ao passar do limite numa janela de 60 s, como o Sheets faz.
+        self.arquivo, self.latencia, self.erro_cota, self.cota_por_minuto = arquivo, latencia, erro_cota, cota_por_minuto
+        if dados is None and arquivo and os.path.exists(arquivo):
+            with open(arquivo, encoding="utf-8") as f: dados = json.load(f)
+        self.dados = {aba: [list(l) for l in linhas] for aba, linhas in (dados or ABAS_PADRAO).items()}
+        self.lock = threading.Lock()
+        self.chamadas = deque()
+
+    def _chamar(self, operacao, escrita=True):
+        lat = self.latencia
+        time.sleep(random.uniform(*lat) if isinstance(lat, (tuple, list)) else lat)
+        with self.lock:
+            agora = time.time()
+            while self.chamadas and agora - self.chamadas[0] > 60: self.chamadas.popleft()
+            if random.random() < self.erro_cota or (self.cota_por_minuto and len(self.chamadas) >= self.cota_por_minuto):
+                CONTADORES["erros_cota"] += 1
+                raise erro_api(429, "Quota exceeded for quota metric 'Read requests' (planilha local)")
+            self.chamadas.append(agora)
+            CONTADORES["escritas" if escrita else "leituras"] += 1
+            resultado = operacao()
+            if escrita: self._salvar()
+            return resultado
+
+    def _salvar(self):
+        if not self.arquivo: return
+        tmp = self.arquivo + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(self.dados, f, ensure_ascii=False)
+        os.replace(tmp, self.arquivo)
+
+    def _aba(self, nome):
+        if nome not in self.dados: raise WorksheetNotFound(nome)
+        return Aba(self, nome)
+
+    def worksheet(self, titulo):
+        return self._chamar(lambda: self._aba(titulo), escrita=False)
+
+    def worksheets(self):
+        return [Aba(self, t) for t in self.dados]
+
+    def values_get(self, intervalo, params=None):
+        aba, celulas = _separar(intervalo)
+        return self._chamar(lambda: {"range": intervalo, "values": self._aba(aba)._ler(celulas)}, escrita=False)
+
+    def values_batch_get(self, ranges, params=None):
+        def ler():
+            return {"valueRanges": [{"range": r, "values": self._aba(_separar(r)[0])._ler(_separar(r)[1])} for r in ranges]}
+        return self._chamar(ler, escrita=False)
+
+    def values_batch_update(self, body=None):
+        def gravar():
+            for item in body["data"]:
+                aba, celulas = _separar(item["range"])
+                li, _, ci, _ = _limites(celulas or "A1")
+                self._aba(aba)._gravar(li + 1, ci + 1, item["values"])
+            return {"totalUpdatedRows": sum(len(item["values"]) for item in body["data"])}
+        return self._chamar(gravar)
+
+    def values_append(self, range, params=None, body=None):
+        def gravar():
+            aba = self._aba(_separar(range)[0])
+            ini = len(aba._ler()) + 1 # depois da última linha com dado, como a API
+            aba._gravar(ini, 1, body["values"])
+            fim = ini + len(body["values"]) - 1
+            return {"updates": {"updatedRange": f"'{aba.title}'!A{ini}:Z{fim}", "updatedRows": len(body["values"])}}
+        return self._chamar(gravar)
+
+class Cliente:
+    # Uma planilha por cliente; a chave do open_by_key é ignorada.
+    def __init__(self, **opcoes):
+        self.planilha = Planilha(**opcoes)
+
+    def open_by_key(self, key):
+        return self.planilha
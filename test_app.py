@@ -0,0 +1,209 @@
+"""Testes das funções do app.py contra a planilha local (planilha_local.py), sem o Google Sheets.
+
+O app.py é um script do Streamlit: o fixture `app` executa o código dele até a interface num módulo
+novo, com cache_resource limpo e o espelho e o diário numa pasta temporária.
+
+    python -m pytest -q test_app.py
+"""
+import json
+import os
+import threading
+import time
+import types
+from datetime import date, timedelta
+
+import pytest
+import streamlit as st
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DATA = (date.today() + timedelta(days=3)).strftime("%d/%m/%Y")
+
+@pytest.fixture
+def carregar_app(tmp_path, monkeypatch):
+    # carregar(**env): as configurações lidas na importação (ESPELHO_ARQUIVO...) entram antes do exec
+    carregados = []
+    def carregar(**env):
+        monkeypatch.chdir(tmp_path)
+        for chave, valor in {"PLANILHA_BACKEND": "local", **env}.items(): monkeypatch.setenv(chave, valor)
+        st.cache_resource.clear()
+        with open(APP, encoding="utf-8") as f: fonte = f.read()
+        mod = types.ModuleType("app")
+        exec(compile(fonte[:fonte.index("# --- 4. STYLE ---")], APP, "exec"), mod.__dict__)
+        carregados.append(mod)
+        return mod
+    yield carregar
+    # As threads do app (atualizador, reaplicador do diário) não param: sem liderança e sem espelho
+    # elas não leem nem publicam nada no cache_resource dos próximos testes
+    for mod in carregados: mod.eh_lider, mod.acompanhar_espelho = (lambda: False), (lambda cache: 0.0)
+
+@pytest.fixture
+def app(carregar_app):
+    return carregar_app()
+
+def esperar(condicao, limite=5):
+    # Para o que as threads do app fazem em segundo plano (fila do espelho)
+    fim = time.time() + limite
+    while not condicao() and time.time() < fim: time.sleep(0.02)
+    return condicao()
+
+def evento(nome, v1="", v2=""):
+    return [nome, DATA, "08:00", "Som", "BAS", "", "", v1, v2]
+
+def planilha(app, eventos, usuarios=()):
+    dados = app.get_planilha().dados
+    dados["Calendario_Eventos"][1:] = [list(e) for e in eventos]
+    dados["Usuarios"][1:] = [list(u) for u in usuarios]
+    return dados
+
+def test_delta_traz_voluntario_novo(app):
+    dados = planilha(app, [evento("Ev A"), evento("Ev B")])
+    app.atualizar_cache(completo=True)
+    cache = app.get_cache_dados()
+    dados["Calendario_Eventos"][2][7] = "Carol"
+    assert app.sincronizar_delta(cache) is True
+    assert cache["df_ev"].at[1, "Voluntário 1"] == "Carol"
+    assert app.conflito_agenda("carol", DATA, "08:00") == 1
+
+def test_delta_rele_tudo_se_as_linhas_mudaram_de_evento(app):
+    # Apagar uma linha e acrescentar outra mantém a contagem; o delta não pode levar Carol de "Ev C" para "Ev B"
+    dados = planilha(app, [evento("Ev A"), evento("Ev B"), evento("Ev C", "Carol")])
+    app.atualizar_cache(completo=True)
+    cache = app.get_cache_dados()
+    del dados["Calendario_Eventos"][2]
+    dados["Calendario_Eventos"].append(evento("Ev D"))
+    assert app.sincronizar_delta(cache) is False
+    assert cache["df_ev"].at[1, "Voluntário 1"] == ""
+    assert app.conflito_agenda("carol", DATA, "08:00") == 2
+
+def test_delta_rele_tudo_se_os_emails_mudaram(app):
+    dados = planilha(app, [evento("Ev A")], [["ana@x.org", "Ana", "", "Som", "BAS"], ["bia@x.org", "Bia", "", "Som", "BAS"]])
+    app.atualizar_cache(completo=True)
+    del dados["Usuarios"][1]
+    dados["Usuarios"].append(["caio@x.org", "Caio", "", "Som", "BAS"])
+    assert app.sincronizar_delta(app.get_cache_dados()) is False
+
+def test_sem_espelho_segue_so_com_a_planilha(carregar_app, tmp_path):
+    app = carregar_app(ESPELHO_ARQUIVO=str(tmp_path / "nao_existe" / "espelho.sqlite3"))
+    planilha(app, [evento("Ev A")])
+    assert app.get_espelho() is None and app.eh_lider()
+    app.atualizar_cache(completo=True)
+    assert app.carregar_espelho(app.inicio_janela()) is None and app.estado_espelho()["seq"] is None
+    app.atualizar_evento_cache(2, 8, "Ana")
+    assert app.get_cache_dados()["df_ev"].at[0, "Voluntário 1"] == "Ana"
+
+def test_sem_diario_as_escritas_vao_direto(carregar_app, tmp_path):
+    app = carregar_app(DIARIO_ARQUIVO=str(tmp_path / "nao_existe" / "diario.sqlite3"))
+    planilha(app, [evento("Ev A")], [["ana@x.org", "Ana", "", "Som", "BAS"]])
+    app.atualizar_cache(completo=True)
+    assert app.get_diario() is None
+    assert app.registrar_no_diario("inscricao", "inscricao:2:ana", {"linha": 2}) is None # o app cai na escrita direta
+    assert app.diario_pendentes() == 0 and app.inscricoes_pendentes("ana") == set()
+    assert app.usuario_atual("ana@x.org")[1]["Nome"] == "Ana"
+
+def test_inscricao_publica_so_a_vaga_que_mudou(app):
+    # Reler as duas vagas iguais ao cache não gera versão, aviso no feed nem linha em `mudancas`
+    planilha(app, [evento("Ev A"), evento("Ev B")])
+    app.atualizar_cache(completo=True)
+    cache, feed, con = app.get_cache_dados(), app.get_feed(), app.get_espelho()["con"]
+    contar = lambda: (cache["versao"], feed["seq"], con.execute("SELECT COUNT(*) FROM mudancas").fetchone()[0])
+    antes = contar()
+    assert app.reservar_vaga(2, app.evento_atual(0), 8, "Ana") == "ok"
+    assert app.get_planilha().dados["Calendario_Eventos"][1][7] == "Ana"
+    assert esperar(lambda: contar()[2] > antes[2])
+    time.sleep(0.1)
+    assert [b - a for a, b in zip(antes, contar())] == [1, 1, 1]
+
+def test_inscricao_confere_a_linha_na_planilha(app):
+    dados = planilha(app, [evento("Ev A", "Bia"), evento("Ev B")])
+    app.atualizar_cache(completo=True)
+    ev_a, ev_b = app.evento_atual(0), app.evento_atual(1)
+    dados["Calendario_Eventos"][1][8] = "Caio" # outra instância pegou a segunda vaga
+    assert app.reservar_vaga(2, ev_a, 9, "Ana") == "cheio"
+    assert app.get_cache_dados()["df_ev"].at[0, "Voluntário 2"] == "Caio"
+    del dados["Calendario_Eventos"][1] # Ev B subiu para a linha 2
+    assert app.reservar_vaga(3, ev_b, 8, "Ana") == "mudou"
+    assert all("Ana" not in linha for linha in dados["Calendario_Eventos"])
+
+def test_diario_reaplica_linhas_diferentes_no_mesmo_lote(app, monkeypatch):
+    # Inscrições em eventos diferentes saem num só values_batch_update; na mesma linha, em ordem
+    planilha(app, [evento("Ev A"), evento("Ev B")])
+    app.atualizar_cache(completo=True)
+    monkeypatch.setattr(app, "eh_lider", lambda: False) # o reaplicador em segundo plano fica parado
+    for linha, nome in ((2, "Ana"), (3, "Caio"), (2, "Bia")):
+        dados = {"linha": linha, "coluna": 8, "nome": nome, "evento": app._evento_exibido(app.evento_atual(linha - 2))}
+        assert app.registrar_no_diario("inscricao", f"inscricao:{linha}:{nome.lower()}", dados) is not None
+    pl, lotes = app.get_planilha(), []
+    original = pl.values_batch_update
+    monkeypatch.setattr(pl, "values_batch_update", lambda body=None: (lotes.append(len(body["data"])), original(body))[1])
+    d = app.get_diario()
+    for fut in app._reaplicar_pendentes(d): fut.result()
+    assert lotes == [2, 1]
+    assert [linha[7:9] for linha in pl.dados["Calendario_Eventos"][1:]] == [["Ana", "Bia"], ["Caio", ""]]
+    assert d["con"].execute("SELECT COUNT(*) FROM diario WHERE estado = 'aplicado' AND resultado = 'ok'").fetchone()[0] == 3
+
+def test_sincronizar_junta_cliques_numa_leitura_do_atualizador(app):
+    dados = planilha(app, [evento("Ev A")])
+    app.atualizar_cache(completo=True)
+    app.get_atualizador()
+    dados["Calendario_Eventos"].append(evento("Ev B"))
+    leituras, resultados = app.get_metricas().contadores.get("atualizacao_completa", 0), []
+    cliques = [threading.Thread(target=lambda: resultados.append(app.sincronizar())) for _ in range(4)]
+    for t in cliques: t.start()
+    for t in cliques: t.join()
+    assert resultados == [True] * 4
+    assert app.get_metricas().contadores["atualizacao_completa"] - leituras <= 2 # no máximo a que já estava em curso + uma
+    assert list(app.get_cache_dados()["df_ev"]["Nome do Evento"]) == ["Ev A", "Ev B"]
+
+def test_escrita_no_cache_nao_espera_o_espelho(app):
+    # Com o espelho ocupado (ex.: salvar_espelho reescrevendo as tabelas), o write-through e as sessões seguem
+    planilha(app, [evento("Ev A")])
+    app.atualizar_cache(completo=True)
+    esp = app.get_espelho()
+    with esp["lock"]:
+        t0 = time.time()
+        app.atualizar_evento_cache(2, 8, "Ana")
+        assert time.time() - t0 < 0.5 and app.evento_atual(0)["Voluntário 1"] == "Ana"
+    assert esperar(lambda: esp["con"].execute('SELECT "Voluntário 1" FROM eventos WHERE _linha = 2').fetchone()[0] == "Ana")
+
+def test_limitador_separa_as_cotas_de_leitura_e_escrita(app, monkeypatch):
+    for _ in range(app.RAJADA_API): app.chamar_api("leitura", lambda: None)
+    t0 = time.time()
+    app.chamar_api("escrita", lambda: None) # o balde de escrita continua cheio
+    assert time.time() - t0 < 0.2
+    assert app.get_limitador()["baldes"]["leitura"]["tokens"] < 1
+
+    monkeypatch.setattr(app, "LIMITE_POR_MINUTO", 10 ** 7)
+    antes = app.contadores_api()["leitura_chamadas"]
+    sessoes = [threading.Thread(target=lambda: [app.chamar_api("leitura", lambda: None) for _ in range(200)]) for _ in range(8)]
+    for t in sessoes: t.start()
+    for t in sessoes: t.join()
+    assert app.contadores_api()["leitura_chamadas"] - antes == 1600
+
+def test_janela_deixa_os_eventos_antigos_no_espelho(carregar_app):
+    app = carregar_app(JANELA_DIAS="5")
+    antigo = (date.today() - timedelta(days=30)).strftime("%d/%m/%Y")
+    dados = planilha(app, [["Antigo", antigo, "08:00", "Som", "BAS", "", "", "Ana"], evento("Ev A")])
+    app.atualizar_cache(completo=True)
+    cache = app.get_cache_dados()
+    assert list(cache["df_ev"].index) == [1] and cache["n_linhas"] == 2
+    assert app.eventos_arquivo(date.today()) is None
+    assert list(app.eventos_arquivo(date.today() - timedelta(days=40))["Nome do Evento"]) == ["Antigo"]
+    dados["Calendario_Eventos"][2][7] = "Bia" # o delta conta a linha arquivada e compara só as da janela
+    assert app.sincronizar_delta(cache) is True and cache["df_ev"].at[1, "Voluntário 1"] == "Bia"
+
+def test_replica_aplica_as_mudancas_dos_outros_processos(app):
+    planilha(app, [evento("Ev A"), evento("Ev B")], [["ana@x.org", "Ana", "", "Som", "BAS"]])
+    app.atualizar_cache(completo=True)
+    cache, esp = app.get_cache_dados(), app.get_espelho()
+    app.acompanhar_espelho(cache) # alinha geração e seq com o espelho que acabou de ser salvo
+    gravar = lambda origem, linha, valores: esp["con"].execute(
+        "INSERT INTO mudancas (origem, tabela, linha, valores, inserir) VALUES (?, 'eventos', ?, ?, 0)", (origem, linha, json.dumps(valores)))
+    gravar("outro", 3, {"Voluntário 1": "Caio"})
+    gravar(esp["origem"], 2, {"Voluntário 1": "Zé"}) # deste processo: já está no cache
+    versao = cache["versao"]
+    app.acompanhar_espelho(cache)
+    assert cache["df_ev"].at[1, "Voluntário 1"] == "Caio" and cache["df_ev"].at[0, "Voluntário 1"] == ""
+    assert app.conflito_agenda("caio", DATA, "08:00") == 1 and cache["versao"] == versao + 1
+    assert cache["seq"] == app.estado_espelho()["seq"]
+    app.acompanhar_espelho(cache) # nada novo: nenhuma versão a mais
+    assert cache["versao"] == versao + 1
@@ -0,0 +1,67 @@
+"""Testes do eventos.py.
+
+    python -m pytest -q test_eventos.py
+"""
+import random
+from datetime import date, timedelta
+
+import bench
+import eventos as ev
+
+def calendario(n=400, semente=7):
+    # Calendário sintético do bench, mais datas que não convertem (NaT) e um nível fora do mapa (Niv_N 99)
+    rnd = random.Random(semente)
+    linhas = bench.gerar_eventos(rnd, n, bench.gerar_nomes(rnd, 30), n_deps=6, dias=60)
+    for linha in linhas[1:n // 10]: linha[1] = rnd.choice(["", "a definir", "31/02/2025"])
+    for linha in linhas[n // 10:n // 5]: linha[4] = "Desconhecido"
+    return ev.preparar_eventos(ev.montar_df(linhas))
+
+def test_motor_igual_filtrar_eventos():
+    df = calendario()
+    assert df['Data_Dt'].isna().any() and (df['Niv_N'] == 99).any()
+    motor, rnd = ev.MotorFiltros(df, versao=1), random.Random(3)
+    deps_todos = sorted(df['Departamento'].astype(str).unique())
+    niveis = list(ev.cores_niveis) + ["Desconhecido"]
+    for _ in range(300):
+        deps = tuple(rnd.sample(deps_todos, rnd.randint(0, len(deps_todos))))
+        consulta = dict(deps=deps, nivel_usuario=rnd.choice(niveis + ["Nao existe"]),
+                        data_ini=date.today() + timedelta(days=rnd.randint(-70, 70)),
+                        depto=rnd.choice(["Todos"] + deps_todos), nivel=rnd.choice(["Todos"] + niveis),
+                        status=rnd.choice(ev.STATUS_FILTRO),
+                        inscritos=tuple(rnd.sample(list(df.index), rnd.randint(0, 40))))
+        esperado = ev.filtrar_eventos(df, **consulta)
+        for _ in range(2): # segunda vez sai do LRU
+            obtido, _ = motor.filtrar(**consulta)
+            assert list(obtido.index) == list(esperado.index), consulta
+
+def test_motor_minhas_inscricoes_muda_com_inscritos():
+    # A mesma consulta com inscrições diferentes (ex.: uma pendente no diário) não pode vir do LRU
+    df = calendario()
+    motor, deps = ev.MotorFiltros(df, versao=1), tuple(df['Departamento'].astype(str).unique())
+    base = dict(deps=deps, nivel_usuario="AV4A", data_ini=date.today() - timedelta(days=400), status="Minhas Inscrições")
+    validos = list(df.index[df['Data_Dt'].notna() & (df['Niv_N'] != 99)])
+    antes, _ = motor.filtrar(**base, inscritos=validos[:3])
+    depois, memo = motor.filtrar(**base, inscritos=validos[:3] + [validos[3]])
+    assert not memo and set(antes.index) == set(validos[:3]) and set(depois.index) == set(validos[:4])
+
+def test_preparar_janela_separa_por_data():
+    hoje = date.today()
+    linhas = [bench.CAB_EVENTOS,
+              ["Antigo", (hoje - timedelta(days=10)).strftime("%d/%m/%Y"), "08:00", "Som", "BAS"],
+              ["Hoje", hoje.strftime("%d/%m/%Y"), "08:00", "Som", "BAS"],
+              ["Sem data", "a definir", "08:00", "Som", "BAS"],
+              ["Futuro", (hoje + timedelta(days=10)).strftime("%d/%m/%Y"), "08:00", "Som", "BAS"]]
+    quentes, arquivo = ev.preparar_janela(ev.montar_df(linhas), hoje)
+    assert set(quentes['Nome do Evento']) == {"Hoje", "Sem data", "Futuro"}
+    assert list(arquivo['Nome do Evento']) == ["Antigo"] and list(arquivo.index) == [0]
+    assert 'Card_HTML' in quentes.columns and 'Card_HTML' not in arquivo.columns
+
+    tudo, vazio = ev.preparar_janela(ev.montar_df(linhas), None)
+    assert len(tudo) == 4 and vazio.empty
+
+def test_montar_df_completa_linhas_curtas():
+    df = ev.montar_df([[" Email ", "Nome", "Telefone"], ["a@x.org"], ["b@x.org", "Bia", "11", "sobra"]])
+    assert list(df.columns) == ["Email", "Nome", "Telefone"]
+    assert df.values.tolist() == [["a@x.org", "", ""], ["b@x.org", "Bia", "11"]]
+    vazio = ev.montar_df([], ev.COLS_USUARIOS)
+    assert vazio.empty and list(vazio.columns) == ev.COLS_USUARIOS